@@ -0,0 +1,209 @@
+import hashlib
+from typing import Callable, Dict, List, Tuple
+from xml.etree import ElementTree as ET
+
+try:
+    from Entities import Activity
+except ImportError:
+    from .Entities import Activity
+
+
+class ActivityRecord:
+    """
+    Everything the importer reads from one 'iati-activity' element, as plain values. Where the element has several
+    children of a tag that is used once (budget, reporting-org, recipient-country, recipient-region), the first one
+    counts, like ET.Element.find.
+    """
+    __slots__ = ("identifier", "title", "description", "status", "dates", "content_hash", "budget", "reporting_org",
+                 "participating_orgs", "policy_markers", "recipient_country", "recipient_region", "transactions",
+                 "disbursements")
+
+    def __init__(self):
+        self.identifier = None
+        self.title = None
+        self.description = None
+        self.status = None
+        self.dates = []
+        self.content_hash = None
+        self.budget = None
+        self.reporting_org = None
+        self.participating_orgs = []
+        self.policy_markers = []
+        self.recipient_country = None
+        self.recipient_region = None
+        self.transactions = []
+        self.disbursements = []
+
+    def get_location(self) -> Tuple[str, str]:
+        # The recipient country, else the recipient region.
+        return self.recipient_country if self.recipient_country is not None else self.recipient_region
+
+    identifier: str
+    title: str
+    description: str
+    status: int
+    dates: List[Activity.ActivityDate]
+    content_hash: str
+    # (period start, period end, value, type, status)
+    budget: Tuple[str, str, int, int, int]
+    # (name, ref, type)
+    reporting_org: Tuple[str, str, int]
+    participating_orgs: List[Tuple[str, str, int]]
+    # (code, name, significance)
+    policy_markers: List[Tuple[int, str, int]]
+    # (code, name)
+    recipient_country: Tuple[str, str]
+    recipient_region: Tuple[str, str]
+    # (type, date, value, provider ref, provider name, receiver ref, receiver name)
+    transactions: List[Tuple[int, str, int, str, str, str, str]]
+    # (period start, period end, value)
+    disbursements: List[Tuple[str, str, int]]
+
+
+def get_narrative(node: ET.Element) -> str:
+    narrative = node.find("narrative")
+    return narrative.text if narrative is not None else None
+
+
+def get_int(value: str) -> int:
+    return int(value) if value is not None else None
+
+
+def get_org(node: ET.Element) -> Tuple[str, str, int]:
+    return get_narrative(node), node.get("ref"), get_int(node.get("type"))
+
+
+def get_period(node: ET.Element) -> Tuple[str, str, int]:
+    # Budgets and planned disbursements: (period start, period end, value). They have a few children only, finding
+    # each one (in C) is faster than dispatching on them in Python.
+    return node.find("period-start").get("iso-date"), node.find("period-end").get("iso-date"), \
+        int(node.find("value").text)
+
+
+def get_transaction(node: ET.Element) -> Tuple[int, str, int, str, str, str, str]:
+    provider_node = node.find("provider-org")
+    receiver_node = node.find("receiver-org")
+    return int(node.find("transaction-type").get("code")), node.find("transaction-date").get("iso-date"), \
+        int(node.find("value").text), provider_node.get("ref"), get_narrative(provider_node), \
+        receiver_node.get("ref"), get_narrative(receiver_node)
+
+
+def set_identifier(record: ActivityRecord, node: ET.Element) -> None:
+    if record.identifier is None:
+        record.identifier = node.text
+
+
+def set_title(record: ActivityRecord, node: ET.Element) -> None:
+    if record.title is None:
+        record.title = get_narrative(node)
+
+
+def set_description(record: ActivityRecord, node: ET.Element) -> None:
+    if record.description is None:
+        record.description = get_narrative(node)
+
+
+def set_status(record: ActivityRecord, node: ET.Element) -> None:
+    if record.status is None:
+        record.status = int(node.get("code"))
+
+
+def add_date(record: ActivityRecord, node: ET.Element) -> None:
+    record.dates.append(Activity.ActivityDate(int(node.get("type")), node.get("iso-date")))
+
+
+def set_budget(record: ActivityRecord, node: ET.Element) -> None:
+    if record.budget is None:
+        # http://iatistandard.org/202/activity-standard/iati-activities/iati-activity/budget/
+        ty = node.get("type")
+        status = node.get("status")
+        record.budget = get_period(node) + (int(ty) if ty is not None else 0,
+                                            int(status) if status is not None else 1)
+
+
+def set_reporting_org(record: ActivityRecord, node: ET.Element) -> None:
+    if record.reporting_org is None:
+        record.reporting_org = get_org(node)
+
+
+def add_participating_org(record: ActivityRecord, node: ET.Element) -> None:
+    record.participating_orgs.append(get_org(node))
+
+
+def add_policy_marker(record: ActivityRecord, node: ET.Element) -> None:
+    record.policy_markers.append((int(node.get("code")), get_narrative(node), int(node.get("significance"))))
+
+
+def set_recipient_country(record: ActivityRecord, node: ET.Element) -> None:
+    if record.recipient_country is None:
+        record.recipient_country = (node.get("code"), get_narrative(node))
+
+
+def set_recipient_region(record: ActivityRecord, node: ET.Element) -> None:
+    if record.recipient_region is None:
+        record.recipient_region = (node.get("code"), get_narrative(node))
+
+
+def add_transaction(record: ActivityRecord, node: ET.Element) -> None:
+    record.transactions.append(get_transaction(node))
+
+
+def add_disbursement(record: ActivityRecord, node: ET.Element) -> None:
+    record.disbursements.append(get_period(node))
+
+
+# Tag of a child of 'iati-activity' -> function reading it into the record. Other children are skipped.
+ACTIVITY_SCHEMA: Dict[str, Callable[[ActivityRecord, ET.Element], None]] = {
+    "iati-identifier": set_identifier,
+    "title": set_title,
+    "description": set_description,
+    "activity-status": set_status,
+    "activity-date": add_date,
+    "budget": set_budget,
+    "reporting-org": set_reporting_org,
+    "participating-org": add_participating_org,
+    "policy-marker": add_policy_marker,
+    "recipient-country": set_recipient_country,
+    "recipient-region": set_recipient_region,
+    "transaction": add_transaction,
+    "planned-disbursement": add_disbursement
+}
+
+
+class ActivityExtractor:
+    def __init__(self, content_hash: bool = False):
+        """
+        :param content_hash: Also set the content hash of the records. Serializing and hashing the element takes most of
+        the time of extract, so only do it when the hash is used, to compare the activities of a delta import.
+        """
+        self.content_hash = content_hash
+
+    def extract(self, node: ET.Element) -> ActivityRecord:
+        """
+        Reads an activity in one pass over its children, instead of a find / iter over the element per field.
+        Usage:
+        extractor = ActivityExtractor()
+        for activity_node in ActivityReader.iter_activities(file):
+            record = extractor.extract(activity_node)
+        :param node: 'iati-activity' element.
+        :type node: ET.Element
+        :rtype: ActivityRecord
+        """
+        record = ActivityRecord()
+        schema = ACTIVITY_SCHEMA
+        for child in node:
+            handler = schema.get(child.tag)
+            if handler is not None:
+                handler(record, child)
+        if self.content_hash:
+            record.content_hash = ActivityExtractor.get_content_hash(node)
+        return record
+
+    @staticmethod
+    def get_content_hash(node: ET.Element) -> str:
+        # The tail (whitespace after the closing tag) is not part of the activity, and may not be parsed yet while
+        # streaming.
+        tail, node.tail = node.tail, None
+        content_hash = hashlib.sha1(ET.tostring(node, encoding="utf-8")).hexdigest()
+        node.tail = tail
+        return content_hash
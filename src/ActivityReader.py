@@ -0,0 +1,48 @@
+from typing import BinaryIO, Iterator, Union
+from xml.etree import ElementTree as ET
+
+try:
+    from CompressedInput import open_input
+except ImportError:
+    from .CompressedInput import open_input
+
+ACTIVITY_TAG = "iati-activity"
+
+
+class ActivityReader:
+    @staticmethod
+    def iter_activities(file: Union[str, BinaryIO], streaming: bool = True) -> Iterator[ET.Element]:
+        """
+        Usage:
+        for activity_node in ActivityReader.iter_activities("../data/IATIACTIVITIES20162017.xml"):
+            ...
+        :param file: Path of the IATI XML file, which may be compressed or in a zip archive (see open_input), or the
+        file opened in binary mode.
+        :type file: Union[str, BinaryIO]
+        :param streaming: Parse the file incrementally instead of building the whole tree first.
+        :type streaming: bool
+        :return: The 'iati-activity' elements of the file, in document order.
+        :rtype: Iterator[ET.Element]
+        """
+        if isinstance(file, str):
+            with open_input(file) as f:
+                yield from ActivityReader.iter_activities(f, streaming)
+            return
+
+        if not streaming:
+            tree = ET.ElementTree(file=file)
+            yield from tree.iter(ACTIVITY_TAG)
+            return
+
+        root: ET.Element = None
+        for event, elem in ET.iterparse(file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != ACTIVITY_TAG:
+                continue
+            yield elem
+            # The caller is done with this activity once it asks for the next one, so release the subtree (and the
+            # references the root still holds to it) before parsing further.
+            root.clear()
@@ -0,0 +1,107 @@
+import csv
+import os
+from typing import Any, Dict, List, Set, TextIO, Tuple, Union
+
+ARRAY_DELIMITER = ";"
+
+
+def get_field_type(v: Any) -> str:
+    # https://neo4j.com/docs/operations-manual/current/tools/neo4j-admin/neo4j-admin-import/#import-tool-header-format
+    if type(v) is bool:
+        return ":boolean"
+    elif type(v) is int:
+        return ":long"
+    elif type(v) is float:
+        return ":double"
+    elif type(v) is list:
+        return ":string[]"
+    else:
+        return ""
+
+
+def get_field_value(v: Any) -> Any:
+    if v is None:
+        return ""
+    elif type(v) is list:
+        return ARRAY_DELIMITER.join(str(item) for item in v)
+    return v
+
+
+class CsvTable:
+    def __init__(self, path: str, id_fields: List[str], keys: List[str], sample: Dict[str, Any]):
+        self.path = path
+        self.keys = keys
+        self._file: TextIO = open(path, "w", encoding="utf8", newline="")
+        self._writer = csv.writer(self._file, quoting=csv.QUOTE_MINIMAL)
+        self._writer.writerow(id_fields + [k + get_field_type(sample[k]) for k in keys])
+        self.row_count = 0
+
+    def write(self, id_values: List[Any], props: Dict[str, Any]) -> None:
+        self._writer.writerow(id_values + [get_field_value(props.get(k)) for k in self.keys])
+        self.row_count += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class AdminCsvWriter:
+    """
+    Writes the nodes and edges of an import as header + data CSV files for 'neo4j-admin import', one file per node
+    label and per relation type. The column types are taken from the first row of each file.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._node_tables: Dict[str, CsvTable] = dict()
+        self._edge_tables: Dict[str, CsvTable] = dict()
+        # Relation class -> (start id, end id) pairs already written, for the unique relations.
+        self._unique_edges: Dict[str, Set[Tuple[int, int]]] = dict()
+
+    def add_node(self, class_name: str, props: Union[dict, None] = None) -> None:
+        props = props if props is not None else dict()
+        table = self._node_tables.get(class_name)
+        if table is None:
+            keys = [k for k in props.keys() if k != "obj_id"]
+            table = CsvTable(os.path.join(self.directory, "nodes_{}.csv".format(class_name)),
+                             ["obj_id:ID", ":LABEL"], keys, props)
+            self._node_tables[class_name] = table
+        table.write([props["obj_id"], class_name], props)
+
+    def add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                 edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        edge_class = edge_class.upper()
+        if is_unique:
+            written = self._unique_edges.setdefault(edge_class, set())
+            if (n1_id, n2_id) in written:
+                return
+            written.add((n1_id, n2_id))
+        edge_props = edge_props if edge_props is not None else dict()
+        table = self._edge_tables.get(edge_class)
+        if table is None:
+            table = CsvTable(os.path.join(self.directory, "edges_{}.csv".format(edge_class)),
+                             [":START_ID", ":END_ID", ":TYPE"], list(edge_props.keys()), edge_props)
+            self._edge_tables[edge_class] = table
+        table.write([n1_id, n2_id, edge_class], edge_props)
+
+    def flush(self) -> None:
+        for table in list(self._node_tables.values()) + list(self._edge_tables.values()):
+            table.flush()
+
+    def clear(self) -> None:
+        # Rows are written straight to the files, there is nothing buffered to throw away.
+        pass
+
+    def close(self) -> None:
+        for table in list(self._node_tables.values()) + list(self._edge_tables.values()):
+            table.close()
+
+    def get_import_command(self, database: str = "graph.db") -> str:
+        args = ["neo4j-admin import", "--database={}".format(database), "--id-type=INTEGER",
+                "--multiline-fields=true", "--array-delimiter='{}'".format(ARRAY_DELIMITER)]
+        args += ["--nodes={}".format(table.path) for table in self._node_tables.values()]
+        args += ["--relationships={}".format(table.path) for table in self._edge_tables.values()]
+        return " ".join(args)
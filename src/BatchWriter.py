@@ -0,0 +1,227 @@
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+NODE_TPL = "UNWIND $rows AS r CREATE (n:{}) SET n = r"
+EDGE_TPL = "UNWIND $rows AS r " \
+           "MATCH (n1:{} {{obj_id: r.n1_id}}), (n2:{} {{obj_id: r.n2_id}}) " \
+           "{} (n1)-[t:{}]->(n2) SET t = r.props"
+# Creates the node unless a node with the same key exists already (written by this or another process).
+UPSERT_NODE_TPL = "UNWIND $rows AS r MERGE (n:{0} {{{1}: r.{1}}}) ON CREATE SET n = r"
+# Like EDGE_TPL, with the property matching each end node.
+UPSERT_EDGE_TPL = "UNWIND $rows AS r " \
+                  "MATCH (n1:{} {{{}: r.n1_id}}), (n2:{} {{{}: r.n2_id}}) " \
+                  "{} (n1)-[t:{}]->(n2) SET t = r.props"
+
+# (start class, end class, relation class, is unique)
+EdgeKey = Tuple[str, str, str, bool]
+
+
+def get_row(props: Union[dict, None]) -> Dict[str, Any]:
+    # Literal statements write None as an empty string (see get_escaped_str), keep it that way for parameters.
+    if props is None:
+        return dict()
+    return {k: ("" if v is None else v) for k, v in props.items()}
+
+
+class BatchWriter:
+    """
+    Collects node and edge rows per label / relation type and writes them as parameterized 'UNWIND $rows' statements,
+    so the statement text (and its query plan) is shared by every row of the same shape.
+    """
+
+    def __init__(self, run: Callable[..., None], batch_size: int = 1000, partitions: int = 1,
+                 shared_classes: Sequence[str] = ()):
+        """
+        :param run: Callback executing a statement with its parameters, e.g. SessionExtension.run. With more than one
+        partition, it also gets the partition of the rows of a relation batch.
+        :type run: Callable[..., None]
+        :param batch_size: Number of rows of one label / relation type that triggers a flush.
+        :type batch_size: int
+        :param partitions: Number of partitions the relation batches are split into, e.g. the sessions of a
+        SessionPool. The relations of one node go to the same partition: the end node of a class in shared_classes
+        (e.g. the organization of a TRANSACTS relation), else the start node (e.g. the activity). So the partitions
+        rarely lock the same nodes.
+        :type partitions: int
+        :param shared_classes: Classes of the nodes shared between activities.
+        :type shared_classes: Sequence[str]
+        """
+        self._run = run
+        self._batch_size = batch_size
+        self._partitions = partitions
+        self._shared_classes = frozenset(shared_classes)
+        self._node_rows: Dict[str, List[Dict[str, Any]]] = dict()
+        self._edge_rows: Dict[EdgeKey, List[Dict[str, Any]]] = dict()
+
+    def add_node(self, class_name: str, props: Union[dict, None] = None) -> None:
+        rows = self._node_rows.setdefault(class_name, [])
+        rows.append(get_row(props))
+        if len(rows) >= self._batch_size:
+            self.flush()
+
+    def add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                 edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        key = (n1_class, n2_class, edge_class.upper(), is_unique)
+        rows = self._edge_rows.setdefault(key, [])
+        rows.append({"n1_id": n1_id, "n2_id": n2_id, "props": get_row(edge_props)})
+        if len(rows) >= self._batch_size:
+            self.flush()
+
+    def get_node_query(self, class_name: str) -> str:
+        return NODE_TPL.format(class_name)
+
+    def get_edge_query(self, key: EdgeKey) -> str:
+        n1_class, n2_class, edge_class, is_unique = key
+        return EDGE_TPL.format(n1_class, n2_class, "MERGE" if is_unique else "CREATE", edge_class)
+
+    def flush(self) -> None:
+        # Nodes go first, the edges of this batch may point at them.
+        for class_name, rows in self._node_rows.items():
+            if len(rows) > 0:
+                self._run(self.get_node_query(class_name), {"rows": rows})
+        for key, rows in self._edge_rows.items():
+            if len(rows) == 0:
+                continue
+            if self._partitions <= 1:
+                self._run(self.get_edge_query(key), {"rows": rows})
+                continue
+            # Split by the shared end node, else by the start node.
+            id_name = "n2_id" if key[1] in self._shared_classes else "n1_id"
+            parts: List[List[Dict[str, Any]]] = [[] for _ in range(self._partitions)]
+            for row in rows:
+                parts[hash(row[id_name]) % self._partitions].append(row)
+            for partition, part in enumerate(parts):
+                if len(part) > 0:
+                    self._run(self.get_edge_query(key), {"rows": part}, partition)
+        self.clear()
+
+    def clear(self) -> None:
+        self._node_rows.clear()
+        self._edge_rows.clear()
+
+
+class UpsertBatchWriter(BatchWriter):
+    """
+    BatchWriter for several processes writing into the same database. Shared nodes (organizations, policies,
+    locations) are MERGEd on their key, which must have a uniqueness constraint, and relations find them by that key:
+    their obj_id is the one of the process that created them first, not necessarily the one of this process.
+    """
+
+    def __init__(self, run: Callable[..., None], batch_size: int, shared_keys: Dict[str, str], partitions: int = 1):
+        """
+        :param shared_keys: Node class -> name of the property identifying a shared node of that class.
+        :type shared_keys: Dict[str, str]
+        """
+        super().__init__(run, batch_size, partitions, shared_keys.keys())
+        self._shared_keys = shared_keys
+        # obj_id of a shared node added to this writer -> its key
+        self._shared_refs: Dict[int, Any] = dict()
+
+    def add_node(self, class_name: str, props: Union[dict, None] = None) -> None:
+        key_name = self._shared_keys.get(class_name)
+        if key_name is not None:
+            self._shared_refs[props["obj_id"]] = props[key_name]
+        super().add_node(class_name, props)
+
+    def add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                 edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        if n1_class in self._shared_keys:
+            n1_id = self._shared_refs[n1_id]
+        if n2_class in self._shared_keys:
+            n2_id = self._shared_refs[n2_id]
+        super().add_edge(n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique)
+
+    def get_node_query(self, class_name: str) -> str:
+        key_name = self._shared_keys.get(class_name)
+        if key_name is None:
+            return super().get_node_query(class_name)
+        return UPSERT_NODE_TPL.format(class_name, key_name)
+
+    def get_edge_query(self, key: EdgeKey) -> str:
+        n1_class, n2_class, edge_class, is_unique = key
+        return UPSERT_EDGE_TPL.format(n1_class, self._shared_keys.get(n1_class, "obj_id"),
+                                      n2_class, self._shared_keys.get(n2_class, "obj_id"),
+                                      "MERGE" if is_unique else "CREATE", edge_class)
+
+
+class RecordingWriter:
+    """
+    Keeps all nodes and edges in memory instead of writing them, so they can be built in a worker process and written
+    (replayed) by another one.
+    """
+
+    # Also records the transaction and disbursement rows of SessionExtension.add_flows.
+    keeps_flows = True
+
+    def __init__(self, on_flush: Callable[["RecordingWriter"], None] = None):
+        """
+        :param on_flush: If given, every flush (commit) passes what has been recorded since the previous one to it, as
+        a RecordingWriter of its own, and starts over. Replay the chunks in order, with the same id_map.
+        """
+        self._on_flush = on_flush
+        self.nodes: List[Tuple[str, Dict[str, Any]]] = []
+        self.edges: List[Tuple[str, int, str, int, str, Dict[str, Any], bool]] = []
+        # (activity obj_id, budget obj_id, transaction rows, disbursement rows)
+        self.flows: List[Tuple[int, int, List[tuple], List[tuple]]] = []
+        self._flushed_nodes = 0
+        self._flushed_edges = 0
+        self._flushed_flows = 0
+
+    def add_node(self, class_name: str, props: Union[dict, None] = None) -> None:
+        self.nodes.append((class_name, props if props is not None else dict()))
+
+    def add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                 edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        self.edges.append((n1_class, n1_id, n2_class, n2_id, edge_class,
+                           edge_props if edge_props is not None else dict(), is_unique))
+
+    def add_flows(self, activity_id: int, budget_id: int, transactions: List[tuple], disbursements: List[tuple]) \
+            -> None:
+        self.flows.append((activity_id, budget_id, transactions, disbursements))
+
+    def flush(self) -> None:
+        if self._on_flush is not None:
+            chunk = RecordingWriter()
+            chunk.nodes, chunk.edges, chunk.flows = self.nodes, self.edges, self.flows
+            self.nodes, self.edges, self.flows = [], [], []
+            self._on_flush(chunk)
+            return
+        self._flushed_nodes = len(self.nodes)
+        self._flushed_edges = len(self.edges)
+        self._flushed_flows = len(self.flows)
+
+    def clear(self) -> None:
+        del self.nodes[self._flushed_nodes:]
+        del self.edges[self._flushed_edges:]
+        del self.flows[self._flushed_flows:]
+
+    def replay(self, ext: Any, shared_ids: Dict[Tuple[str, Any], int], shared_keys: Dict[str, str],
+               id_map: Dict[int, int] = None) -> None:
+        """
+        :param ext: SessionExtension receiving the nodes and edges.
+        :param shared_ids: (node class, key) -> obj_id of the shared nodes written so far. Updated by this call.
+        :type shared_ids: Dict[Tuple[str, Any], int]
+        :param shared_keys: Node class -> name of the property identifying a shared node of that class.
+        :type shared_keys: Dict[str, str]
+        :param id_map: obj_id of a recorded duplicate -> obj_id of the shared node written before. Updated by this
+        call; pass the same one to the chunks of a recording, as their edges refer to the nodes of previous chunks.
+        :type id_map: Dict[int, int]
+        """
+        if id_map is None:
+            id_map = dict()
+        for class_name, props in self.nodes:
+            key_name = shared_keys.get(class_name)
+            if key_name is not None:
+                key = (class_name, props[key_name])
+                obj_id = shared_ids.get(key)
+                if obj_id is not None:
+                    id_map[props["obj_id"]] = obj_id
+                    continue
+                shared_ids[key] = props["obj_id"]
+            ext.add_node("n", class_name, props)
+        for n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique in self.edges:
+            ext.add_edge(n1_class, id_map.get(n1_id, n1_id), n2_class, id_map.get(n2_id, n2_id),
+                         edge_class, edge_props, is_unique)
+        for activity_id, budget_id, transactions, disbursements in self.flows:
+            # (type, date, value, provider obj_id, receiver obj_id, provider ref, receiver ref)
+            ext.add_flow_rows(activity_id, budget_id, [
+                row[:3] + (id_map.get(row[3], row[3]), id_map.get(row[4], row[4])) + row[5:] for row in transactions
+            ], disbursements)
@@ -0,0 +1,179 @@
+import random
+from time import sleep
+from typing import Any, Dict, List, Tuple
+
+import neo4j.exceptions as neo_ex
+import neo4j.v1 as neo
+
+try:
+    from WriteSink import WriteSink
+except ImportError:
+    from .WriteSink import WriteSink
+
+# Errors after which the same transaction may succeed when run again, like deadlocks and lock timeouts between
+# concurrent writers (Neo.TransientError.*).
+RETRY_ERRORS = (neo_ex.TransientError,)
+DEADLOCK_CODE = "Neo.TransientError.Transaction.DeadlockDetected"
+
+
+class BoltSink(WriteSink):
+    """
+    Sends the statements to a running database through a Bolt session.
+    """
+    session: neo.Session = None
+    _transaction: neo.Transaction = None
+
+    def __init__(self, session: neo.Session, retries: int = 0, retry_delay: float = 0.5):
+        """
+        :param session: Session all statements are run in.
+        :param retries: How often a transaction failing with one of RETRY_ERRORS is run again, 0 disables. The
+        statements of the open transaction (and their parameters) are kept in memory until it commits for that, so
+        only use retries with concurrent writers, and commit regularly.
+        :type retries: int
+        :param retry_delay: Seconds to wait before the first retry. The delay doubles with every retry of the same
+        transaction, with some jitter so concurrent writers do not collide again.
+        :type retry_delay: float
+        """
+        self.session = session
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Number of retries in total, and of those after a deadlock.
+        self.retried = 0
+        self.deadlocks = 0
+        self._statements: List[Tuple[str, Dict[str, Any]]] = []
+
+    def begin_transaction(self) -> None:
+        if self._transaction is None:
+            self._transaction = self.session.begin_transaction()
+            self._statements = []
+
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        if self.retries > 0:
+            self._statements.append((query, parameters))
+        self._transaction.run(query, parameters)
+
+    def commit(self) -> None:
+        if self._transaction is None:
+            return
+        try:
+            if self.retries == 0:
+                self._transaction.commit()
+            else:
+                self._commit_with_retries()
+        finally:
+            # Committing closes the transaction, also when it fails.
+            self._transaction = None
+            self._statements = []
+
+    def rollback(self) -> None:
+        if self._transaction is None:
+            return
+        self._transaction.rollback()
+        self._transaction = None
+        self._statements = []
+
+    def _commit_with_retries(self) -> None:
+        # Transaction.run does not wait for the result, so the errors of the statements show up when committing. The
+        # transaction is gone then: start a new one, run all its statements again and commit that one.
+        attempt = 0
+        while True:
+            try:
+                if attempt > 0:
+                    self._transaction = self.session.begin_transaction()
+                    for query, parameters in self._statements:
+                        self._transaction.run(query, parameters)
+                self._transaction.commit()
+                return
+            except RETRY_ERRORS as ex:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                code = getattr(ex, "code", type(ex).__name__)
+                if code == DEADLOCK_CODE:
+                    self.deadlocks += 1
+                self._discard_transaction()
+                delay = self.retry_delay * 2 ** (attempt - 1) * random.uniform(1.0, 1.5)
+                print("[WARN] Transaction failed ({}), retry {} of {} in {:.1f} s"
+                      .format(code, attempt, self.retries, delay))
+                sleep(delay)
+
+    def _discard_transaction(self) -> None:
+        # A failed commit usually closes the transaction already (closing it again raises a TransactionError since
+        # driver 1.7). If not, it may not even be closable anymore; it is rolled back by the server anyway.
+        if not self._transaction.closed():
+            try:
+                self._transaction.close()
+            except (neo_ex.CypherError, neo.TransactionError):
+                pass
+        self._transaction = None
+
+    def run_autocommit(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        self.session.run(query, parameters)
+
+    def query(self, query: str, parameters: Dict[str, Any] = None) -> List[Any]:
+        return list(self.session.run(query, parameters))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+if __name__ == '__main__':
+    # Retries against a session that behaves like the one of driver 1.7: committing closes the transaction, also when
+    # it fails, and closing it again raises a TransactionError. The first commit fails with a deadlock.
+    class FakeTransaction:
+        def __init__(self, session: "FakeSession"):
+            self.session = session
+            self.statements = []
+            self._closed = False
+
+        def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+            self.statements.append(query)
+
+        def commit(self) -> None:
+            self.close()
+            if self.session.failures > 0:
+                self.session.failures -= 1
+                error = neo_ex.TransientError("Deadlock")
+                error.code = DEADLOCK_CODE
+                raise error
+            self.session.committed.append(self.statements)
+
+        def rollback(self) -> None:
+            self.close()
+
+        def close(self) -> None:
+            if self._closed:
+                raise neo.TransactionError("Transaction closed")
+            self._closed = True
+
+        def closed(self) -> bool:
+            return self._closed
+
+    class FakeSession:
+        def __init__(self, failures: int):
+            self.failures = failures
+            self.committed = []
+
+        def begin_transaction(self) -> FakeTransaction:
+            return FakeTransaction(self)
+
+    fake_session = FakeSession(1)
+    sink = BoltSink(fake_session, retries=2, retry_delay=0.01)
+    sink.begin_transaction()
+    sink.run("CREATE (n:A)")
+    sink.run("CREATE (n:B)")
+    sink.commit()
+    assert fake_session.committed == [["CREATE (n:A)", "CREATE (n:B)"]], fake_session.committed
+    assert sink.retried == 1 and sink.deadlocks == 1
+    # Without retries the error reaches the caller, after which the sink can start a new transaction.
+    sink = BoltSink(FakeSession(1))
+    sink.begin_transaction()
+    sink.run("CREATE (n:A)")
+    try:
+        sink.commit()
+        raise AssertionError("The commit should have failed")
+    except neo_ex.TransientError:
+        pass
+    sink.rollback()
+    print("BoltSink retries OK")
@@ -0,0 +1,221 @@
+import sys
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+try:
+    from ColumnarWriter import load_table
+    from LocationRegions import get_parent_regions, get_region_closure
+    from WriteSink import WriteSink
+except ImportError:
+    from .ColumnarWriter import load_table
+    from .LocationRegions import get_parent_regions, get_region_closure
+    from .WriteSink import WriteSink
+
+# The Cypher rollups answered by BudgetAggregator, for all groups at once. Their window is a calendar year, like
+# 'WHERE _1 <= com.period_start < _1 + 10000' with _1 = yyyy0101.
+LOCATION_YEAR_CYPHER = "MATCH (act:Activity)-[:EXECUTED_IN]->(loc:Location) " \
+                       "MATCH (act:Activity)-[com:COMMITS]->(bud:Budget) " \
+                       "WITH DISTINCT act, loc, bud, com " \
+                       "RETURN loc.code, com.period_start / 10000 AS year, sum(bud.value)"
+REGION_YEAR_CYPHER = "MATCH (act:Activity)-[:EXECUTED_IN]->(loc:Location) " \
+                     "MATCH (act:Activity)-[com:COMMITS]->(bud:Budget) " \
+                     "MATCH (loc:Location)-[:BELONGS_TO]->(loc2:Location) " \
+                     "WITH DISTINCT act, loc2, bud, com " \
+                     "RETURN loc2.code, com.period_start / 10000 AS year, sum(bud.value)"
+# Like REGION_YEAR_CYPHER, but over all regions a location belongs to (the IN_REGION closure).
+REGION_ROLLUP_YEAR_CYPHER = "MATCH (act:Activity)-[:EXECUTED_IN]->(loc:Location) " \
+                            "MATCH (act:Activity)-[com:COMMITS]->(bud:Budget) " \
+                            "MATCH (loc:Location)-[:IN_REGION]->(reg:Location) " \
+                            "WITH DISTINCT act, reg, bud, com " \
+                            "RETURN reg.code, com.period_start / 10000 AS year, sum(bud.value)"
+POLICY_YEAR_CYPHER = "MATCH (act:Activity)-[com:COMMITS]->(bud:Budget)-[:FUNDS]->(pol:Policy) " \
+                     "WITH DISTINCT pol, bud, com " \
+                     "RETURN pol.code, com.period_start / 10000 AS year, sum(bud.value)"
+
+# Loads everything BudgetAggregator needs from the database, in three queries.
+BUDGETS_CYPHER = "MATCH (act:Activity)-[com:COMMITS]->(bud:Budget) " \
+                 "OPTIONAL MATCH (act)-[:EXECUTED_IN]->(loc:Location) " \
+                 "RETURN bud.obj_id, bud.value, com.period_start, coalesce(loc.code, '')"
+FUNDINGS_CYPHER = "MATCH (bud:Budget)-[:FUNDS]->(pol:Policy) RETURN bud.obj_id, pol.code"
+LOCATIONS_CYPHER = "MATCH (loc:Location) RETURN loc.code"
+
+# Group keys are group index * YEAR_RANGE + year.
+YEAR_RANGE = 10000
+
+
+def group_sum(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: The distinct keys (sorted) and the sum of the values per key, as exact integers.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    if len(keys) == 0:
+        return keys, np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    return sorted_keys[starts], np.add.reduceat(values[order], starts)
+
+
+class BudgetAggregator:
+    """
+    Budget values grouped by (location, year), (region, year) and (policy, year), computed with NumPy from arrays
+    loaded once, instead of matching all COMMITS relations for every query. The year is the one of the start of the
+    budget period, and the results equal the ones of the *_YEAR_CYPHER queries.
+    """
+
+    def __init__(self, budget_ids: Sequence[int], values: Sequence[int], period_starts: Sequence[int],
+                 location_codes: Sequence[str], funding_budget_ids: Sequence[int], funding_policy_codes: Sequence[int],
+                 imported_location_codes: Sequence[str] = None):
+        """
+        :param budget_ids: obj_id per budget.
+        :param values: Value per budget.
+        :param period_starts: Start of the period (yyyymmdd) per budget.
+        :param location_codes: Code of the location of the activity per budget, '' if unknown.
+        :param funding_budget_ids: obj_id of the budget per FUNDS relation.
+        :param funding_policy_codes: Code of the policy per FUNDS relation.
+        :param imported_location_codes: Codes of all Location nodes. The region relations only exist between those, so
+        a location does not roll up to a region without a node. By default the locations of the budgets.
+        """
+        budget_ids = np.asarray(budget_ids, dtype=np.int64)
+        order = np.argsort(budget_ids)
+        self.budget_ids = budget_ids[order]
+        self.values = np.asarray(values, dtype=np.int64)[order]
+        self.years = np.asarray(period_starts, dtype=np.int64)[order] // 10000
+        # Locations as indices into location_codes.
+        self.location_codes, location_index = np.unique(np.asarray(location_codes, dtype=str)[order],
+                                                        return_inverse=True)
+        self.location_index = location_index.reshape(-1)
+
+        funding_budget_ids = np.asarray(funding_budget_ids, dtype=np.int64)
+        funding_budgets = np.searchsorted(self.budget_ids, funding_budget_ids)
+        found = funding_budgets < len(self.budget_ids)
+        found[found] = self.budget_ids[funding_budgets[found]] == funding_budget_ids[found]
+        self.policy_codes, policy_index = np.unique(np.asarray(funding_policy_codes, dtype=np.int64)[found],
+                                                    return_inverse=True)
+        # A (budget, policy) pair counts once, however many FUNDS relations it has, like the DISTINCT of the Cypher.
+        pairs = np.unique(funding_budgets[found] * len(self.policy_codes) + policy_index.reshape(-1))
+        self.funding_budgets = pairs // max(len(self.policy_codes), 1)
+        self.funding_policy_index = pairs % max(len(self.policy_codes), 1)
+
+        # Direct and transitive (location, region) pairs, between imported locations only.
+        imported = set(self.location_codes.tolist() if imported_location_codes is None
+                       else [str(code) for code in imported_location_codes])
+        self._region_pairs = {False: self._get_region_pairs(get_parent_regions(), imported),
+                              True: self._get_region_pairs(get_region_closure(), imported)}
+
+    def _get_region_pairs(self, regions: Dict[str, Iterable[str]], imported: Set[str]) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Region codes, and the pairs as indices into location_codes and those region codes.
+        pairs = [(i, region_code) for i, code in enumerate(self.location_codes.tolist())
+                 for region_code in regions.get(code, []) if region_code in imported]
+        region_codes, region_index = np.unique(np.array([region for _, region in pairs], dtype=str),
+                                               return_inverse=True)
+        return region_codes, np.array([i for i, _ in pairs], dtype=np.int64), region_index.reshape(-1)
+
+    @staticmethod
+    def from_columnar(directory: str) -> "BudgetAggregator":
+        """
+        :param directory: Output of an import with OUTPUT_COLUMNAR (ColumnarWriter).
+        """
+        budgets = load_table(directory, "budgets")
+        locations = load_table(directory, "locations")
+        fundings = load_table(directory, "fundings")
+        policies = load_table(directory, "policies")
+
+        def get_codes(obj_ids: np.ndarray, table: Dict[str, np.ndarray], missing: Any) -> np.ndarray:
+            # obj_id -> code of the node, by binary search in the (sorted) obj_ids of the table.
+            order = np.argsort(table["obj_id"])
+            table_ids = table["obj_id"][order]
+            table_codes = table["code"][order]
+            index = np.searchsorted(table_ids, obj_ids)
+            found = index < len(table_ids)
+            found[found] = table_ids[index[found]] == obj_ids[found]
+            codes = np.full(len(obj_ids), missing, dtype=table_codes.dtype if len(table_codes) > 0 else object)
+            codes[found] = table_codes[index[found]]
+            return codes
+
+        return BudgetAggregator(budgets["budget_id"], budgets["value"], budgets["period_start"],
+                                get_codes(budgets["location_id"], locations, ""),
+                                fundings["budget_id"], get_codes(fundings["policy_id"], policies, -1), locations["code"])
+
+    @staticmethod
+    def from_database(sink: WriteSink) -> "BudgetAggregator":
+        budgets = sink.query(BUDGETS_CYPHER)
+        fundings = sink.query(FUNDINGS_CYPHER)
+        locations = sink.query(LOCATIONS_CYPHER)
+        return BudgetAggregator([r[0] for r in budgets], [r[1] for r in budgets], [r[2] for r in budgets],
+                                [r[3] for r in budgets], [r[0] for r in fundings], [r[1] for r in fundings],
+                                [r[0] for r in locations])
+
+    @staticmethod
+    def _to_dict(group_codes: np.ndarray, keys: np.ndarray, sums: np.ndarray) -> Dict[Tuple[Any, int], int]:
+        return {(code, int(year)): int(total) for code, year, total in
+                zip(group_codes[keys // YEAR_RANGE].tolist(), keys % YEAR_RANGE, sums.tolist())}
+
+    def by_location_year(self) -> Dict[Tuple[str, int], int]:
+        """
+        :return: (location code, year) -> sum of the budget values, as LOCATION_YEAR_CYPHER.
+        :rtype: Dict[Tuple[str, int], int]
+        """
+        known = self.location_codes[self.location_index] != ""
+        keys, sums = group_sum(self.location_index[known] * YEAR_RANGE + self.years[known], self.values[known])
+        return self._to_dict(self.location_codes, keys, sums)
+
+    def by_region_year(self, transitive: bool = False) -> Dict[Tuple[str, int], int]:
+        """
+        :param transitive: Roll every location up to all regions it belongs to (e.g. 'ML' to 289, 298 and 998), as
+        REGION_ROLLUP_YEAR_CYPHER, instead of only the regions it directly belongs to.
+        :return: (region code, year) -> sum of the budget values of the locations belonging to the region
+        (country_region_map, other_belongings), as REGION_YEAR_CYPHER.
+        :rtype: Dict[Tuple[str, int], int]
+        """
+        region_codes, pair_locations, pair_regions = self._region_pairs[transitive]
+        # Repeat every budget once per region its location belongs to.
+        order = np.argsort(pair_locations, kind="stable")
+        pair_regions = pair_regions[order]
+        counts = np.bincount(pair_locations, minlength=len(self.location_codes))
+        firsts = np.cumsum(counts) - counts
+        budget_counts = counts[self.location_index]
+        budgets = np.repeat(np.arange(len(self.budget_ids)), budget_counts)
+        # Position of each repeated row within the regions of its location.
+        offsets = np.arange(len(budgets)) - np.repeat(np.cumsum(budget_counts) - budget_counts, budget_counts)
+        regions = pair_regions[firsts[self.location_index[budgets]] + offsets]
+        keys, sums = group_sum(regions * YEAR_RANGE + self.years[budgets], self.values[budgets])
+        return self._to_dict(region_codes, keys, sums)
+
+    def by_policy_year(self) -> Dict[Tuple[int, int], int]:
+        """
+        :return: (policy code, year) -> sum of the values of the budgets funding the policy, as POLICY_YEAR_CYPHER.
+        :rtype: Dict[Tuple[int, int], int]
+        """
+        keys, sums = group_sum(self.funding_policy_index * YEAR_RANGE + self.years[self.funding_budgets],
+                               self.values[self.funding_budgets])
+        return self._to_dict(self.policy_codes, keys, sums)
+
+    @staticmethod
+    def query_cypher(sink: WriteSink, query: str) -> Dict[Tuple[Any, int], int]:
+        return {(record[0], int(record[1])): int(record[2]) for record in sink.query(query)}
+
+    def check_against_cypher(self, sink: WriteSink) -> List[str]:
+        """
+        Runs the Cypher versions on the database of the sink.
+        :return: Names of the group-bys with a different result, empty if all are equal.
+        :rtype: List[str]
+        """
+        checks = [("location_year", self.by_location_year, LOCATION_YEAR_CYPHER),
+                  ("region_year", self.by_region_year, REGION_YEAR_CYPHER),
+                  ("region_rollup_year", lambda: self.by_region_year(True), REGION_ROLLUP_YEAR_CYPHER),
+                  ("policy_year", self.by_policy_year, POLICY_YEAR_CYPHER)]
+        return [name for name, func, query in checks if func() != BudgetAggregator.query_cypher(sink, query)]
+
+
+if __name__ == '__main__':
+    aggregator = BudgetAggregator.from_columnar(sys.argv[1] if len(sys.argv) > 1 else "../columnar")
+    for name, func in [("location x year", aggregator.by_location_year), ("region x year", aggregator.by_region_year),
+                       ("region rollup x year", lambda: aggregator.by_region_year(True)),
+                       ("policy x year", aggregator.by_policy_year)]:
+        start = perf_counter()
+        result = func()
+        print("{}: {} groups in {:.1f} ms".format(name, len(result), (perf_counter() - start) * 1000))
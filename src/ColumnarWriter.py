@@ -0,0 +1,163 @@
+import os
+from array import array
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+
+# Table -> ((column, array typecode), ...). Typecode "u" columns are strings, kept in lists.
+# The *_id columns are obj_ids, -1 if unknown. Dates are yyyymmdd integers.
+TABLES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    # From the COMMITS edges, one row per budget.
+    "budgets": (("budget_id", "q"), ("activity_id", "q"), ("location_id", "q"), ("value", "q"),
+                ("period_start", "i"), ("period_end", "i")),
+    # One row per transaction of the activity, commitments (type 2) included, also when the provider or receiver is
+    # not one of its organizations (provider_id / receiver_id -1). The refs are the ones of the organizations table.
+    "transactions": (("budget_id", "q"), ("activity_id", "q"), ("location_id", "q"), ("provider_id", "q"),
+                     ("receiver_id", "q"), ("provider_ref", "u"), ("receiver_ref", "u"), ("type", "b"), ("date", "i"),
+                     ("value", "q")),
+    # One row per planned disbursement of the activity. In the graph it is a PLANS_DISBURSEMENT relation to every
+    # partner organization instead.
+    "disbursements": (("budget_id", "q"), ("activity_id", "q"), ("location_id", "q"), ("period_start", "i"),
+                      ("period_end", "i"), ("value", "q")),
+    # From the FUNDS edges, the policies a budget contributes to.
+    "fundings": (("budget_id", "q"), ("activity_id", "q"), ("policy_id", "q")),
+    # obj_id -> keys of the shared nodes.
+    "activities": (("obj_id", "q"), ("identifier", "u")),
+    "locations": (("obj_id", "q"), ("code", "u"), ("name", "u")),
+    "organizations": (("obj_id", "q"), ("ref", "u"), ("name", "u")),
+    "policies": (("obj_id", "q"), ("code", "q"), ("name", "u"))
+}
+# Columns filled in when the table is written: the location of the activity is only known after its budget.
+LOCATION_COLUMN = "location_id"
+
+
+class ColumnTable:
+    def __init__(self, columns: Tuple[Tuple[str, str], ...]):
+        self.columns = columns
+        self.data: List[Union[array, List[str]]] = [[] if typecode == "u" else array(typecode)
+                                                    for _, typecode in columns]
+
+    def __len__(self) -> int:
+        return len(self.data[0])
+
+    def append(self, *row: Any) -> None:
+        for column, value in zip(self.data, row):
+            column.append(value if value is not None else "")
+
+    def get_arrays(self) -> Dict[str, np.ndarray]:
+        arrays: Dict[str, np.ndarray] = dict()
+        for (name, typecode), column in zip(self.columns, self.data):
+            if typecode == "u":
+                arrays[name] = np.array(column, dtype=str)
+            else:
+                # Shares the memory of the array.array.
+                arrays[name] = np.frombuffer(column, dtype=column.typecode) if len(column) > 0 \
+                    else np.zeros(0, dtype=column.typecode)
+        return arrays
+
+
+class ColumnarWriter:
+    """
+    Writes the numbers of an import (budgets, transactions, planned disbursements) as typed NumPy columns, with the
+    obj_ids of their activity, location and organization, and tables mapping those obj_ids to identifiers, codes and
+    refs. Receives the nodes and edges like BatchWriter, without a database.
+    Every column is written to '<table>.<column>.npy', which load_table() memory-maps; with npz=True every table is
+    one '<table>.npz' instead.
+    """
+    # Receives the transactions and disbursements themselves, see SessionExtension.add_flows.
+    keeps_flows = True
+
+    def __init__(self, directory: str, npz: bool = False):
+        self.directory = directory
+        self.npz = npz
+        os.makedirs(directory, exist_ok=True)
+        self._tables: Dict[str, ColumnTable] = {name: ColumnTable(columns) for name, columns in TABLES.items()}
+        self._budget_values: Dict[int, int] = dict()
+        self._budget_activities: Dict[int, int] = dict()
+        self._activity_locations: Dict[int, int] = dict()
+
+    def add_node(self, class_name: str, props: Union[dict, None] = None) -> None:
+        if class_name == "Budget":
+            self._budget_values[props["obj_id"]] = props["value"]
+        elif class_name == "Activity":
+            self._tables["activities"].append(props["obj_id"], props["identifier"])
+        elif class_name == "Location":
+            self._tables["locations"].append(props["obj_id"], props["code"], props["name"])
+        elif class_name == "Organization":
+            self._tables["organizations"].append(props["obj_id"], props["ref"], props["name"])
+        elif class_name == "Policy":
+            self._tables["policies"].append(props["obj_id"], props["code"], props["name"])
+
+    def add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                 edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        edge_class = edge_class.upper()
+        if edge_class == "COMMITS":
+            self._budget_activities[n2_id] = n1_id
+            self._tables["budgets"].append(n2_id, n1_id, -1, self._budget_values.get(n2_id, 0),
+                                           edge_props["period_start"], edge_props["period_end"])
+        elif edge_class == "EXECUTED_IN":
+            self._activity_locations[n1_id] = n2_id
+        elif edge_class == "FUNDS":
+            self._tables["fundings"].append(n1_id, self._budget_activities.get(n1_id, -1), n2_id)
+
+    def add_flows(self, activity_id: int, budget_id: int, transactions: List[tuple], disbursements: List[tuple]) \
+            -> None:
+        """
+        :param transactions: (type, date, value, provider obj_id, receiver obj_id, provider ref, receiver ref) per
+        transaction, see SessionExtension.add_flows.
+        :param disbursements: (period start, period end, value) per planned disbursement.
+        """
+        table = self._tables["transactions"]
+        for ty, date, value, provider_id, receiver_id, provider_ref, receiver_ref in transactions:
+            table.append(budget_id, activity_id, -1, provider_id, receiver_id, provider_ref, receiver_ref, ty, date,
+                         value)
+        table = self._tables["disbursements"]
+        for period_start, period_end, value in disbursements:
+            table.append(budget_id, activity_id, -1, period_start, period_end, value)
+
+    def flush(self) -> None:
+        pass
+
+    def clear(self) -> None:
+        # Like AdminCsvWriter, rows cannot be taken back once added.
+        pass
+
+    def close(self) -> Dict[str, int]:
+        """
+        Writes all tables.
+        :return: Table -> number of rows.
+        :rtype: Dict[str, int]
+        """
+        counts: Dict[str, int] = dict()
+        for name, table in self._tables.items():
+            arrays = table.get_arrays()
+            if LOCATION_COLUMN in arrays:
+                locations = self._activity_locations
+                arrays[LOCATION_COLUMN] = np.fromiter((locations.get(a, -1) for a in arrays["activity_id"].tolist()),
+                                                      dtype=np.int64, count=len(table))
+            if self.npz:
+                np.savez(os.path.join(self.directory, name + ".npz"), **arrays)
+            else:
+                for column, values in arrays.items():
+                    np.save(os.path.join(self.directory, "{}.{}.npy".format(name, column)), values)
+            counts[name] = len(table)
+        return counts
+
+
+def load_table(directory: str, table: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Usage:
+    budgets = load_table("../columnar", "budgets")
+    total_2014 = budgets["value"][(budgets["period_start"] >= 20140101) & (budgets["period_start"] < 20150101)].sum()
+    :param directory: Directory written by ColumnarWriter.
+    :param table: Name of the table, see TABLES.
+    :param mmap: Memory-map the columns instead of reading them ('.npy' columns only).
+    :return: Column name -> values.
+    :rtype: Dict[str, np.ndarray]
+    """
+    npz_path = os.path.join(directory, table + ".npz")
+    if os.path.exists(npz_path):
+        with np.load(npz_path) as data:
+            return {name: data[name] for name in data.files}
+    return {name: np.load(os.path.join(directory, "{}.{}.npy".format(table, name)), mmap_mode="r" if mmap else None)
+            for name, _ in TABLES[table]}
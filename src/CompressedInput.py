@@ -0,0 +1,203 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+import zipfile
+from typing import BinaryIO, Callable, Tuple
+
+# Decompressed bytes read ahead by the decompression thread: PREFETCH_CHUNKS chunks of PREFETCH_CHUNK_SIZE at most.
+PREFETCH_CHUNK_SIZE = 1 << 20
+PREFETCH_CHUNKS = 8
+
+# File extension -> function opening a compressed stream on a binary file object.
+COMPRESSIONS = {
+    ".gz": lambda f: gzip.GzipFile(fileobj=f, mode="rb"),
+    ".bz2": lambda f: bz2.BZ2File(f, mode="rb"),
+    ".xz": lambda f: lzma.LZMAFile(f, mode="rb")
+}
+# Separates the archive from the member in e.g. "../data/IATIACTIVITIES.zip!IATIACTIVITIES19972007.xml".
+ZIP_MEMBER_SEP = "!"
+
+
+class PrefetchReader(io.RawIOBase):
+    """
+    Reads a (decompressing) stream in a thread of its own, so the decompression overlaps with the parsing of the data
+    read before; zlib, bz2 and lzma release the GIL while decompressing. tell() is the position in the input as the
+    caller sees it for progress: in the compressed file for .gz / .bz2 / .xz files.
+    """
+
+    def __init__(self, stream: BinaryIO, tell: Callable[[], int], close: Callable[[], None] = None,
+                 chunk_size: int = PREFETCH_CHUNK_SIZE, max_chunks: int = PREFETCH_CHUNKS):
+        """
+        :param stream: Stream of decompressed bytes, used by the thread only.
+        :param tell: Position in the input after the last read of the stream.
+        :param close: Closes the stream and whatever it reads from.
+        """
+        super().__init__()
+        self._stream = stream
+        self._tell = tell
+        self._close = close if close is not None else stream.close
+        self._chunk_size = chunk_size
+        # (chunk, position after it); an empty chunk ends the data.
+        self._queue: queue.Queue = queue.Queue(max_chunks)
+        self._stopped = threading.Event()
+        self._error: BaseException = None
+        self._chunk = b""
+        self._offset = 0
+        self._position = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._prefetch, name="PrefetchReader", daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Tuple[bytes, int]) -> bool:
+        # Waits for room in the queue, unless the reader has been closed in the meantime.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _prefetch(self) -> None:
+        try:
+            while True:
+                chunk = self._stream.read(self._chunk_size)
+                if not self._put((chunk, self._tell())) or len(chunk) == 0:
+                    return
+        except BaseException as ex:
+            self._error = ex
+            self._put((b"", self._position))
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._offset >= len(self._chunk):
+            if self._eof:
+                return 0
+            self._chunk, self._position = self._queue.get()
+            self._offset = 0
+            if len(self._chunk) == 0:
+                self._eof = True
+                if self._error is not None:
+                    raise self._error
+                return 0
+        n = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:n] = self._chunk[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._close()
+        super().close()
+
+
+def split_zip_member(path: str) -> Tuple[str, str]:
+    """
+    :return: The archive and the member of a path like "archive.zip!member.xml", the member None for "archive.zip",
+    or (None, None) if the path is not in an archive.
+    :rtype: Tuple[str, str]
+    """
+    archive, sep, member = path.partition(ZIP_MEMBER_SEP)
+    if sep != "" and archive.lower().endswith(".zip"):
+        return archive, member
+    if path.lower().endswith(".zip"):
+        return path, None
+    return None, None
+
+
+def get_zip_member(archive: zipfile.ZipFile, member: str) -> zipfile.ZipInfo:
+    if member is not None:
+        return archive.getinfo(member)
+    # Without a member, the archive must contain one XML file only.
+    members = [info for info in archive.infolist() if info.filename.lower().endswith(".xml")]
+    if len(members) != 1:
+        raise ValueError("'{}' contains {} XML files, name one as '{}{}<member>'".format(
+            archive.filename, len(members), archive.filename, ZIP_MEMBER_SEP))
+    return members[0]
+
+
+def open_input(path: str, threaded: bool = True) -> BinaryIO:
+    """
+    Usage:
+    with open_input("../data/IATIACTIVITIES19972007.xml.gz") as f:
+        for activity_node in ActivityReader.iter_activities(f):
+            ...
+    :param path: XML file, optionally compressed (.gz, .bz2, .xz), or a member of a zip archive
+    ("archive.zip!member.xml", or "archive.zip" if it contains one XML file).
+    :param threaded: Decompress in a thread of its own (PrefetchReader). Uncompressed files are read directly.
+    :return: The (decompressed) XML, in binary mode. Its tell() goes up to get_input_size(path).
+    :rtype: BinaryIO
+    """
+    archive_path, member = split_zip_member(path)
+    if archive_path is not None:
+        archive = zipfile.ZipFile(archive_path)
+        try:
+            stream = archive.open(get_zip_member(archive, member))
+        except BaseException:
+            archive.close()
+            raise
+
+        def close() -> None:
+            stream.close()
+            archive.close()
+
+        if not threaded:
+            return stream
+        # The position in the compressed member is not available, so it is the one in the decompressed one.
+        return PrefetchReader(stream, stream.tell, close)
+
+    compression = COMPRESSIONS.get(os.path.splitext(path)[1].lower())
+    if compression is None:
+        return open(path, "rb")
+    raw = open(path, "rb")
+    try:
+        stream = compression(raw)
+    except BaseException:
+        raw.close()
+        raise
+
+    def close() -> None:
+        stream.close()
+        raw.close()
+
+    if not threaded:
+        return stream
+    return PrefetchReader(stream, raw.tell, close)
+
+
+def get_input_size(path: str) -> int:
+    """
+    :return: Size of the input in bytes: of the file, or of the (decompressed) member of a zip archive.
+    :rtype: int
+    """
+    archive_path, member = split_zip_member(path)
+    if archive_path is None:
+        return os.path.getsize(path)
+    with zipfile.ZipFile(archive_path) as archive:
+        return get_zip_member(archive, member).file_size
+
+
+def get_input_name(path: str) -> str:
+    """
+    :return: Name of the XML file without directory and extensions, e.g. "IATIACTIVITIES19972007" for
+    "../data/IATIACTIVITIES19972007.xml.gz" and "../data/IATI.zip!IATIACTIVITIES19972007.xml".
+    :rtype: str
+    """
+    archive_path, member = split_zip_member(path)
+    name = os.path.basename(member if member else archive_path if archive_path is not None else path)
+    name, ext = os.path.splitext(name)
+    if ext.lower() in COMPRESSIONS or ext.lower() == ".zip":
+        name, ext = os.path.splitext(name)
+    return name if ext.lower() == ".xml" or ext == "" else name + ext
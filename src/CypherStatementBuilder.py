@@ -1,41 +1,66 @@
-from typing import Union, Any
+from typing import Any, Dict, Sequence, Union
 
 
 def get_escaped_str(v: Union[str, list, Any]) -> str:
-    if v is None:
+    t = type(v)
+    if t is int:
+        return str(v)
+    elif v is None:
         # Treat as an empty string.
         return "''"
-    elif type(v) is str:
-        return "'{}'".format(v.replace("\\", "\\\\").replace("'", "\\'"))
-    elif type(v) is list:
-        counter = 0
-        s = ""
-        for item in v:
-            if counter == 0:
-                s = get_escaped_str(item)
-            else:
-                s += ", " + get_escaped_str(item)
-            counter += 1
-        s = "[{}]".format(s)
-        return s
+    elif t is str:
+        return "'" + v.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    elif t is list:
+        return "[" + ", ".join([get_escaped_str(item) for item in v]) + "]"
     else:
         return str(v)
 
 
 def get_props_dict_str(props: dict) -> str:
-    counter = 0
-    props_str = ""
-    if props is not None:
-        for k, v in props.items():
-            if counter == 0:
-                props_str = "{}:{}".format(str(k), get_escaped_str(v))
-            else:
-                props_str += ", {}:{}".format(str(k), get_escaped_str(v))
-            counter += 1
-    if len(props_str) > 0:
-        props_str = " {%s}" % props_str
+    if not props:
+        return ""
+    return " {" + ", ".join([str(k) + ":" + get_escaped_str(v) for k, v in props.items()]) + "}"
+
+
+def get_props_tpl(keys: Sequence[str]) -> str:
+    # '%'-style placeholders for the escaped values, in key order.
+    if len(keys) == 0:
+        return ""
+    return " {" + ", ".join([str(k) + ":%s" for k in keys]) + "}"
+
 
-    return props_str
+def get_props_query(keys: Sequence[str]) -> str:
+    if len(keys) == 0:
+        return ""
+    return " {" + ", ".join(["{0}: ${0}".format(k) for k in keys]) + "}"
+
+
+class CompiledStatement:
+    """
+    A statement shape with fixed classes and property key order, prepared once and then rendered for many rows: either
+    as a literal statement (render) or as a parameterized query (query + get_parameters).
+    Property values are passed in the order of 'keys'.
+    """
+
+    def __init__(self, literal_tpl: str, query: str, arg_names: Sequence[str], keys: Sequence[str]):
+        self._literal_tpl = literal_tpl
+        self._arg_names = tuple(arg_names)
+        self.query = query
+        self.keys = tuple(keys)
+
+    def render(self, args: Sequence[Any], values: Sequence[Any]) -> str:
+        """
+        :param args: Values of the non-property placeholders (node name, or the ids of both nodes).
+        :param values: Property values, in key order.
+        :return: The literal statement, the same as the CypherStatementBuilder method would produce.
+        :rtype: str
+        """
+        return self._literal_tpl % (tuple(args) + tuple([get_escaped_str(v) for v in values]))
+
+    def get_parameters(self, args: Sequence[Any], values: Sequence[Any]) -> Dict[str, Any]:
+        params = {k: ("" if v is None else v) for k, v in zip(self.keys, values)}
+        params.update(zip(self._arg_names, args))
+        return params
 
 
 class CypherStatementBuilder:
@@ -78,8 +103,8 @@ class CypherStatementBuilder:
         """
         props_str = get_props_dict_str(edge_props)
         edge_class_name = edge_class_name.upper()
-        create_str = "CREATE {}({})-[{}:{}{}]->({})".format(n1_name, edge_name if edge_name is not None else "",
-                                                            "UNIQUE " if is_unique else "",
+        create_str = "CREATE {}({})-[{}:{}{}]->({})".format("UNIQUE " if is_unique else "", n1_name,
+                                                            edge_name if edge_name is not None else "",
                                                             edge_class_name, props_str, n2_name)
         return create_str
 
@@ -98,6 +123,70 @@ class CypherStatementBuilder:
                     n1_name, edge_name if edge_name is not None else "", edge_class, props_str, n2_name)
         return create_str
 
+    @staticmethod
+    def compile_node(class_name: str, keys: Sequence[str]) -> CompiledStatement:
+        """
+        Usage:
+        stmt = compile_node("Person", ["name", "born"])
+        stmt.render(["Keanu"], ["Keanu Reeves", 1964])
+        :param class_name: The class name of the new nodes.
+        :type class_name: str
+        :param keys: Property keys, in the order the values will be passed in.
+        :type keys: Sequence[str]
+        :return: Prepared 'create' statement. Its only argument is the node name (not used by the query).
+        :rtype: CompiledStatement
+        """
+        literal_tpl = "CREATE (%s:" + class_name + get_props_tpl(keys) + ")"
+        query = "CREATE (n:{}{})".format(class_name, get_props_query(keys))
+        return CompiledStatement(literal_tpl, query, [], keys)
+
+    @staticmethod
+    def compile_edge_by_ids(n1_name: str, n1_class: str, n2_name: str, n2_class: str, edge_class: str,
+                            keys: Sequence[str], edge_name: str = None, is_unique: bool = False) -> CompiledStatement:
+        """
+        Usage:
+        stmt = compile_edge_by_ids("act", "Activity", "bud", "Budget", "Commits", ["period_start"])
+        stmt.render([1, 2], [20170101])
+        :return: Prepared statement like create_edge_by_ids. Its arguments are the obj_ids of both nodes.
+        :rtype: CompiledStatement
+        """
+        edge_class = edge_class.upper()
+        create_tpl = "CREATE {}({})-[{}:{}%s]->({})".format("UNIQUE " if is_unique else "", n1_name,
+                                                            edge_name if edge_name is not None else "",
+                                                            edge_class, n2_name)
+        match_str = "MATCH ({}:{}), ({}:{}) ".format(n1_name, n1_class, n2_name, n2_class)
+        literal_tpl = match_str + "WHERE {}.obj_id=%s AND {}.obj_id=%s ".format(n1_name, n2_name) \
+            + create_tpl % get_props_tpl(keys)
+        query = match_str + "WHERE {}.obj_id=$n1_id AND {}.obj_id=$n2_id ".format(n1_name, n2_name) \
+            + create_tpl % get_props_query(keys)
+        return CompiledStatement(literal_tpl, query, ["n1_id", "n2_id"], keys)
+
+
+def benchmark(count: int = 100000) -> None:
+    from timeit import timeit
+
+    q = CypherStatementBuilder
+    props = {"planned_period_start": 20050101, "actual_period_start": 20170630, "planned_period_end": 20081231,
+             "actual_period_end": 20170630, "significance": 2}
+    node_props = {"identifier": "NL-1-PPR-100", "description": "Support's legal education", "title": "DHA STD",
+                  "status": 4, "obj_id": 1}
+    edge = q.compile_edge_by_ids("act", "Activity", "pol", "Policy", "Supports", list(props.keys()))
+    node = q.compile_node("Activity", list(node_props.keys()))
+    edge_values = list(props.values())
+    node_values = list(node_props.values())
+    cases = [
+        ("edge, create_edge_by_ids",
+         lambda: q.create_edge_by_ids("act", "Activity", 1, "pol", "Policy", 2, "Supports", props)),
+        ("edge, compiled render", lambda: edge.render((1, 2), edge_values)),
+        ("edge, compiled parameters", lambda: edge.get_parameters((1, 2), edge_values)),
+        ("node, create_node", lambda: q.create_node("act_NL_1_PPR_100", "Activity", node_props)),
+        ("node, compiled render", lambda: node.render(("act_NL_1_PPR_100",), node_values)),
+        ("node, compiled parameters", lambda: node.get_parameters((), node_values)),
+    ]
+    for name, func in cases:
+        seconds = timeit(func, number=count)
+        print("{:<30} {:8.3f} us/statement".format(name, seconds / count * 1e6))
+
 
 if __name__ == '__main__':
     # Test script.
@@ -120,3 +209,22 @@ if __name__ == '__main__':
     assert stmt == "CREATE (Keanu)-[:ACTED_IN]->(TheMatrix)"
     stmt = q.create_edge_by_names("Keanu", "TheMatrix", "acted_in", edge_name="rel1")
     assert stmt == "CREATE (Keanu)-[rel1:ACTED_IN]->(TheMatrix)"
+
+    # Compiled statements must render exactly what the functions above produce.
+    stmt = q.compile_node("Person", ["name", "born"])
+    assert stmt.render(["Keanu"], ["Keanu Reeves", 1964]) == "CREATE (Keanu:Person {name:'Keanu Reeves', born:1964})"
+    assert stmt.query == "CREATE (n:Person {name: $name, born: $born})"
+    assert stmt.get_parameters([], ["Keanu Reeves", None]) == {"name": "Keanu Reeves", "born": ""}
+    assert q.compile_node("Person", []).render(["Keanu"], []) == "CREATE (Keanu:Person)"
+    props = {"roles": ["Neo", "The One"], "quote": "It's 100%", "year": 1999, "note": None}
+    for unique in (False, True):
+        stmt = q.compile_edge_by_ids("k", "Person", "m", "Movie", "acted_in", list(props.keys()), is_unique=unique)
+        assert stmt.render([1, 2], list(props.values())) == \
+            q.create_edge_by_ids("k", "Person", 1, "m", "Movie", 2, "acted_in", props, is_unique=unique)
+    stmt = q.compile_edge_by_ids("k", "Person", "m", "Movie", "acted_in", [], edge_name="rel1")
+    assert stmt.render([1, 2], []) == q.create_edge_by_ids("k", "Person", 1, "m", "Movie", 2, "acted_in",
+                                                            edge_name="rel1")
+    assert stmt.query == "MATCH (k:Person), (m:Movie) WHERE k.obj_id=$n1_id AND m.obj_id=$n2_id " \
+                         "CREATE (k)-[rel1:ACTED_IN]->(m)"
+
+    benchmark()
@@ -0,0 +1,59 @@
+from typing import List, Set, Tuple
+
+try:
+    from SessionExtension import SessionExtension
+except ImportError:
+    from .SessionExtension import SessionExtension
+
+DELETE_STALE_TPL = "UNWIND $rows AS r " \
+                   "MATCH (act:Activity {identifier: r.identifier}) " \
+                   "WHERE coalesce(act.content_hash, '') = r.content_hash " \
+                   "OPTIONAL MATCH (act)-[:COMMITS]->(bud:Budget) " \
+                   "DETACH DELETE act, bud"
+
+
+class DeltaIndex:
+    """
+    (iati-identifier, content hash) pairs of the activities in the database, used by incremental imports: activities
+    whose pair is stored already are skipped, new and changed ones are imported, and the stored pairs that are not
+    seen in the input anymore (changed or withdrawn activities) are deleted afterwards.
+    """
+
+    def __init__(self):
+        self._stored: Set[Tuple[str, str]] = set()
+        self._seen: Set[Tuple[str, str]] = set()
+        self.unchanged = 0
+        self.imported = 0
+
+    def load(self, ext: SessionExtension) -> None:
+        # Activities imported before content hashes existed get '', so they always count as changed.
+        records = ext.query("MATCH (act:Activity) RETURN act.identifier, coalesce(act.content_hash, '')")
+        self._stored = set((record[0], record[1]) for record in records)
+
+    def should_import(self, identifier: str, content_hash: str) -> bool:
+        key = (identifier, content_hash)
+        self._seen.add(key)
+        if key in self._stored:
+            self.unchanged += 1
+            return False
+        self.imported += 1
+        return True
+
+    def get_stale(self) -> List[Tuple[str, str]]:
+        return [key for key in self._stored if key not in self._seen]
+
+    def delete_stale(self, ext: SessionExtension, batch_size: int = 1000) -> int:
+        """
+        Deletes the activities (and their budgets) that are not in the input anymore, in their old version.
+        Must run after all input files have been processed.
+        :return: Number of deleted activity versions.
+        :rtype: int
+        """
+        stale = self.get_stale()
+        ext.begin_transaction()
+        for i in range(0, len(stale), batch_size):
+            rows = [{"identifier": identifier, "content_hash": content_hash}
+                    for identifier, content_hash in stale[i:i + batch_size]]
+            ext.run(DELETE_STALE_TPL, {"rows": rows})
+        ext.commit()
+        return len(stale)
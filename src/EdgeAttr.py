@@ -1,12 +1,9 @@
-from typing import Dict, List, Any
-from xml.etree import ElementTree as ET
+from typing import Any, Dict, Iterable, List, Tuple
 
 try:
     from Entities import *
-    from SessionExtension import SessionExtension
 except ImportError:
     from .Entities import *
-    from .SessionExtension import SessionExtension
 
 
 class ActivityDate:
@@ -18,38 +15,19 @@ class ActivityDate:
 
 class EdgeAttr:
     @staticmethod
-    def get_disbursements(node: ET.Element, parent_activity: Activity) -> List[Disbursement]:
-        disbursements: List[Disbursement] = []
-        for i, disbursement_node in enumerate(node.iter("planned-disbursement")):
-            disbursement_node: ET.Element = disbursement_node
-            period_start: str = disbursement_node.find("period-start").get("iso-date")
-            period_end: str = disbursement_node.find("period-end").get("iso-date")
-            value_node: ET.Element = disbursement_node.find("value")
-            value: int = int(value_node.text)
-            disbursement = Disbursement(period_start, period_end, value, parent_activity, i)
-            disbursements.append(disbursement)
-        return disbursements
+    def make_disbursements(rows: Iterable[Tuple[str, str, int]], parent_activity: Activity) -> List[Disbursement]:
+        # From the (period start, period end, value) rows of an ActivityRecord.
+        return [Disbursement(period_start, period_end, value, parent_activity, i)
+                for i, (period_start, period_end, value) in enumerate(rows)]
 
     @staticmethod
-    def get_transactions(node: ET.Element, organizations: Iterable[Organization] = None) -> List[Transaction]:
-        transactions: List[Transaction] = []
-        for transaction_node in node.iter("transaction"):
-            transaction_node: ET.Element = transaction_node
-            ty = int(transaction_node.find("transaction-type").get("code"))
-            date = transaction_node.find("transaction-date").get("iso-date")
-            value_node: ET.Element = transaction_node.find("value")
-            value = int(value_node.text)
-            value_date = value_node.get("value-date")
-            provider_node: ET.Element = transaction_node.find("provider-org")
-            provider_ref = provider_node.get("ref")
-            provider_name = SessionExtension.narrative(provider_node)
-            receiver_node: ET.Element = transaction_node.find("receiver-org")
-            receiver_ref = receiver_node.get("ref")
-            receiver_name = SessionExtension.narrative(receiver_node)
-            transaction = Transaction(ty, date, value, provider_ref, provider_name,
-                                      receiver_ref, receiver_name, organizations)
-            transactions.append(transaction)
-        return transactions
+    def make_transactions(rows: Iterable[Tuple[int, str, int, str, str, str, str]],
+                          organizations: Iterable[Organization] = None) -> List[Transaction]:
+        # From the rows of an ActivityRecord. Providers and receivers are resolved by key instead of scanning the
+        # organizations for every transaction.
+        org_index = Organization.get_index(organizations) if organizations is not None else None
+        return [Transaction(ty, date, value, provider_ref, provider_name, receiver_ref, receiver_name, org_index)
+                for ty, date, value, provider_ref, provider_name, receiver_ref, receiver_name in rows]
 
     @staticmethod
     def commits(budget: Budget) -> Dict[str, Any]:
@@ -1,5 +1,7 @@
 import re
-from typing import Iterable, Dict
+import sys
+from array import array
+from typing import Iterable, Dict, List, Tuple
 
 next_id_val = 0
 
@@ -14,6 +16,21 @@ def get_next_id() -> int:
     return next_id_val
 
 
+def peek_next_id() -> int:
+    return next_id_val + 1
+
+
+def reset_next_id(last_id: int = 0) -> None:
+    # The next get_next_id() returns last_id + 1.
+    global next_id_val
+    next_id_val = last_id
+
+
+def intern_str(s: str) -> str:
+    # Names, refs and codes repeat for every activity / transaction, keep a single copy of each.
+    return s if s is None else sys.intern(s)
+
+
 def date_str_to_int(date_str: str) -> int:
     return int(date_str.replace("-", ""))
 
@@ -23,7 +40,11 @@ def sanitize_date(date_val: int) -> int:
 
 
 class Activity:
+    __slots__ = ("identifier", "description", "title", "status", "content_hash", "obj_id", "dates")
+
     class ActivityDate:
+        __slots__ = ("type", "date")
+
         def __init__(self, ty: int, date: str):
             self.type = ty
             self.date = date_str_to_int(date)
@@ -31,11 +52,13 @@ class Activity:
         type: int
         date: int
 
-    def __init__(self, identifier: str, description: str, status: int, title: str, dates: Iterable[ActivityDate]):
+    def __init__(self, identifier: str, description: str, status: int, title: str, dates: Iterable[ActivityDate],
+                 content_hash: str = None):
         self.identifier = identifier
         self.description = description
         self.title = title
         self.status = status
+        self.content_hash = content_hash
         self.obj_id = get_next_id()
         self.dates = dict()
         for date in dates:
@@ -48,12 +71,16 @@ class Activity:
     description: str
     title: str
     status: int
+    # Hash of the activity's XML, to detect changed activities in incremental imports.
+    content_hash: str
     obj_id: int
     # For edges
     dates: Dict[int, int]
 
 
 class Budget:
+    __slots__ = ("value", "type", "status", "obj_id", "_parent_activity", "_period_start", "_period_end")
+
     def __init__(self, period_start: str, period_end: str, value: int, ty: int, status: int,
                  parent_activity: Activity):
         self.value = value
@@ -77,6 +104,8 @@ class Budget:
 
 
 class Disbursement:
+    __slots__ = ("period_start", "period_end", "value", "obj_id", "_parent_activity", "_index")
+
     def __init__(self, period_start: str, period_end: str, value: int, parent_activity: Activity,
                  index: int):
         self.period_start = date_str_to_int(period_start)
@@ -98,15 +127,29 @@ class Disbursement:
 
 
 class Organization:
+    __slots__ = ("name", "ref", "type", "obj_id")
+
     def __init__(self, name: str, ref: str, ty: int):
-        self.name = name
-        self.ref = ref
+        self.name = intern_str(name)
+        self.ref = intern_str(ref)
         self.type = ty
         self.obj_id = get_next_id()
 
     def get_name(self) -> str:
-        ref = Organization.get_unique_ref(self.name, self.ref)
-        return ref.replace("-", "_")
+        return Organization.get_key(self.name, self.ref)
+
+    @staticmethod
+    def get_key(name: str, ref: str) -> str:
+        # Normalized unique ref, the same string get_name() returns.
+        return Organization.get_unique_ref(name, ref).replace("-", "_")
+
+    @staticmethod
+    def get_index(orgs: Iterable["Organization"]) -> Dict[str, "Organization"]:
+        index: Dict[str, Organization] = dict()
+        for org in orgs:
+            # Keep the first organization of a key, like a linear search would.
+            index.setdefault(org.get_name(), org)
+        return index
 
     @staticmethod
     def get_unique_ref(name: str, ref: str) -> str:
@@ -124,8 +167,10 @@ class Organization:
 
 
 class Policy:
+    __slots__ = ("name", "code", "obj_id")
+
     def __init__(self, name: str, code: int):
-        self.name = name
+        self.name = intern_str(name)
         self.code = code
         self.obj_id = get_next_id()
 
@@ -142,9 +187,11 @@ class Policy:
 
 
 class Location:
+    __slots__ = ("code", "name", "obj_id")
+
     def __init__(self, code: str, name: str):
-        self.code = code
-        self.name = name
+        self.code = intern_str(code)
+        self.name = intern_str(name)
         self.obj_id = get_next_id()
 
     def get_name(self) -> str:
@@ -157,30 +204,31 @@ class Location:
 
 
 class Transaction:
+    __slots__ = ("type", "date", "value", "provider_ref", "provider_name", "receiver_ref", "receiver_name",
+                 "provider_org", "receiver_org")
+
     def __init__(self, ty: int, date: str, value: int, provider_ref: str, provider_name: str,
-                 receiver_ref: str, receiver_name: str, orgs: Iterable[Organization] = None):
+                 receiver_ref: str, receiver_name: str, org_index: Dict[str, Organization] = None):
         self.type = ty
         self.date = date_str_to_int(date)
         self.value = value
-        self.provider_ref = provider_ref
-        self.receiver_ref = receiver_ref
-        self.provider_name = provider_name
-        self.receiver_name = receiver_name
-        if orgs is not None:
-            def find_org(orgs: Iterable[Organization], ref: str, name: str) -> Organization:
-                key = Organization.get_unique_ref(name, ref).replace("-", "_")
-                try:
-                    org = next(x for x in orgs if x.get_name() == key)
-                except StopIteration:
+        self.provider_ref = intern_str(provider_ref)
+        self.receiver_ref = intern_str(receiver_ref)
+        self.provider_name = intern_str(provider_name)
+        self.receiver_name = intern_str(receiver_name)
+        if org_index is not None:
+            def find_org(ref: str, name: str) -> Organization:
+                key = Organization.get_key(name, ref)
+                org = org_index.get(key)
+                if org is None:
                     if TRANSACTION_DEBUG:
                         print("[WARN] Cannot find responsible organization(s) for transaction: "
                               "date={}, provider={}, receiver={}; key={}"
                               .format(date, provider_name, receiver_name, key))
-                    org = None
                 return org
 
-            self.provider_org = find_org(orgs, self.provider_ref, self.provider_name)
-            self.receiver_org = find_org(orgs, self.receiver_ref, self.receiver_name)
+            self.provider_org = find_org(self.provider_ref, self.provider_name)
+            self.receiver_org = find_org(self.receiver_ref, self.receiver_name)
 
     type: int
     date: int
@@ -191,3 +239,114 @@ class Transaction:
     receiver_name: str
     provider_org: Organization
     receiver_org: Organization
+
+
+class TransactionBatch:
+    """
+    Columnar container for many transactions: the numbers are kept in typed arrays, the (interned) refs and names in
+    lists, and the resolved organizations as obj_ids (-1 if unresolved), without an object per transaction.
+    """
+    __slots__ = ("types", "dates", "values", "provider_refs", "provider_names", "receiver_refs", "receiver_names",
+                 "provider_org_ids", "receiver_org_ids")
+
+    def __init__(self, transactions: Iterable[Transaction] = ()):
+        self.types = array("b")
+        self.dates = array("i")
+        self.values = array("q")
+        self.provider_refs: List[str] = []
+        self.provider_names: List[str] = []
+        self.receiver_refs: List[str] = []
+        self.receiver_names: List[str] = []
+        self.provider_org_ids = array("q")
+        self.receiver_org_ids = array("q")
+        for transaction in transactions:
+            self.append(transaction)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, transaction: Transaction) -> None:
+        self.types.append(transaction.type)
+        self.dates.append(transaction.date)
+        self.values.append(transaction.value)
+        self.provider_refs.append(transaction.provider_ref)
+        self.provider_names.append(transaction.provider_name)
+        self.receiver_refs.append(transaction.receiver_ref)
+        self.receiver_names.append(transaction.receiver_name)
+        provider_org = getattr(transaction, "provider_org", None)
+        receiver_org = getattr(transaction, "receiver_org", None)
+        self.provider_org_ids.append(provider_org.obj_id if provider_org is not None else -1)
+        self.receiver_org_ids.append(receiver_org.obj_id if receiver_org is not None else -1)
+
+    def get_row(self, i: int) -> Tuple[int, int, int, int, int]:
+        # (type, date, value, provider obj_id, receiver obj_id)
+        return self.types[i], self.dates[i], self.values[i], self.provider_org_ids[i], self.receiver_org_ids[i]
+
+
+class DisbursementBatch:
+    """
+    Columnar container for many disbursements, see TransactionBatch. The parent activity is kept as its obj_id.
+    """
+    __slots__ = ("period_starts", "period_ends", "values", "activity_ids", "indices")
+
+    def __init__(self, disbursements: Iterable[Disbursement] = ()):
+        self.period_starts = array("i")
+        self.period_ends = array("i")
+        self.values = array("q")
+        self.activity_ids = array("q")
+        self.indices = array("i")
+        for disbursement in disbursements:
+            self.append(disbursement)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, disbursement: Disbursement) -> None:
+        self.period_starts.append(disbursement.period_start)
+        self.period_ends.append(disbursement.period_end)
+        self.values.append(disbursement.value)
+        self.activity_ids.append(disbursement._parent_activity.obj_id)
+        self.indices.append(disbursement._index)
+
+    def get_row(self, i: int) -> Tuple[int, int, int, int]:
+        # (period start, period end, value, activity obj_id)
+        return self.period_starts[i], self.period_ends[i], self.values[i], self.activity_ids[i]
+
+
+def benchmark_memory(count: int = 100000) -> None:
+    import tracemalloc
+
+    orgs = [Organization("Organization {}".format(i), "XM-{}".format(i), 10) for i in range(50)]
+    org_index = Organization.get_index(orgs)
+    activity = Activity("NL-1-PPR-1", "", 2, "", [])
+
+    def make_transactions() -> List[Transaction]:
+        # Fresh strings for every row, as the XML parser would produce them.
+        return [Transaction(3, "2015-01-01", i, "".join(["XM-", str(i % 50)]), "".join(["Organization ", str(i % 50)]),
+                            "".join(["XM-", str((i + 1) % 50)]), "".join(["Organization ", str((i + 1) % 50)]),
+                            org_index)
+                for i in range(count)]
+
+    def make_disbursements() -> List[Disbursement]:
+        return [Disbursement("2015-01-01", "2015-12-31", i, activity, i) for i in range(count)]
+
+    def measure(build) -> int:
+        tracemalloc.start()
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        return size
+
+    cases = [
+        ("transactions, objects", make_transactions),
+        ("transactions, TransactionBatch", lambda: TransactionBatch(make_transactions())),
+        ("disbursements, objects", make_disbursements),
+        ("disbursements, DisbursementBatch", lambda: DisbursementBatch(make_disbursements())),
+    ]
+    for name, build in cases:
+        print("{:<35} {:8.1f} bytes/row".format(name, measure(build) / count))
+
+
+if __name__ == '__main__':
+    benchmark_memory()
@@ -0,0 +1,68 @@
+from typing import Any, Callable, Dict, Generic, Hashable, Iterator, Set, TypeVar
+
+T = TypeVar("T")
+
+
+class EntityRegistry(Generic[T]):
+    """
+    Entities shared between activities (organizations, policies, locations), keyed by their ref / code.
+    'Known' entities have been built from the XML, 'written' ones have also been sent to the database.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._known: Dict[Hashable, T] = dict()
+        self._written: Set[Hashable] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._known)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._known
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._known.values())
+
+    def get(self, key: Hashable, default: T = None) -> T:
+        return self._known.get(key, default)
+
+    def add(self, key: Hashable, entity: T, written: bool = False) -> None:
+        self._known[key] = entity
+        if written:
+            self._written.add(key)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], T]) -> T:
+        entity = self._known.get(key)
+        if entity is None:
+            self.misses += 1
+            entity = factory()
+            self._known[key] = entity
+        else:
+            self.hits += 1
+        return entity
+
+    def is_written(self, key: Hashable) -> bool:
+        return key in self._written
+
+    def mark_written(self, key: Hashable) -> bool:
+        """
+        :param key: Ref / code of the entity.
+        :return: False if the entity has already been written before.
+        :rtype: bool
+        """
+        if key in self._written:
+            return False
+        self._written.add(key)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "known": len(self._known),
+            "written": len(self._written),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0
+        }
@@ -0,0 +1,90 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+# The progress is also written into the database, as one node per XML file, in the transaction of the activities.
+SAVE_CYPHER = "MERGE (c:ImportCheckpoint {file: $file}) " \
+              "SET c.activities = $activities, c.last_identifier = $last_identifier, c.done = $done, " \
+              "c.last_id = $last_id, c.shared_state = $shared_state"
+LOAD_CYPHER = "MATCH (c:ImportCheckpoint) " \
+              "RETURN c.file, c.activities, c.last_identifier, c.done, c.last_id, c.shared_state"
+DELETE_CYPHER = "MATCH (c:ImportCheckpoint) DELETE c"
+
+
+class ImportCheckpoint:
+    """
+    Progress of an import that has been committed to the database: the number of activities done per XML file and the
+    identifier of the last one, plus the state needed to continue with the same obj_ids and shared nodes.
+    The file is saved after every commit, so a crash in between leaves it behind the database. Therefore the commit
+    also writes the progress into the database (get_save_statement), which wins when resuming (load_database).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # file -> {"activities": int, "last_identifier": str, "done": bool}
+        self.files: Dict[str, Dict[str, Any]] = dict()
+        # Last obj_id handed out before the checkpoint.
+        self.last_id = 0
+        # See SessionExtension.get_shared_state().
+        self.shared_state: Dict[str, List[list]] = dict()
+
+    def load(self) -> bool:
+        """
+        :return: False if there is no checkpoint to resume from.
+        :rtype: bool
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf8") as f:
+            data = json.load(f)
+        self.files = data["files"]
+        self.last_id = data["last_id"]
+        self.shared_state = data["shared_state"]
+        return True
+
+    def get_progress(self, file: str) -> Tuple[int, str, bool]:
+        """
+        :return: Number of committed activities of the file, identifier of the last one, whether the file is done.
+        :rtype: Tuple[int, str, bool]
+        """
+        progress = self.files.get(file)
+        if progress is None:
+            return 0, None, False
+        return progress["activities"], progress["last_identifier"], progress["done"]
+
+    def save(self, file: str, activities: int, last_identifier: str, done: bool, last_id: int,
+             shared_state: Dict[str, List[list]]) -> None:
+        self.files[file] = {"activities": activities, "last_identifier": last_identifier, "done": done}
+        self.last_id = last_id
+        self.shared_state = shared_state
+        # Write to a temporary file first, a crash while saving must not destroy the previous checkpoint.
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump({"files": self.files, "last_id": self.last_id, "shared_state": self.shared_state}, f)
+        os.replace(tmp_path, self.path)
+
+    def get_save_statement(self, file: str, activities: int, last_identifier: str, done: bool, last_id: int,
+                           shared_state: Dict[str, List[list]]) -> Tuple[str, Dict[str, Any]]:
+        """
+        :return: Statement (and its parameters) writing the progress into the database. Run it in the transaction
+        committing the activities, so they cannot be committed without it.
+        :rtype: Tuple[str, Dict[str, Any]]
+        """
+        return SAVE_CYPHER, {"file": file, "activities": activities, "last_identifier": last_identifier,
+                             "done": done, "last_id": last_id, "shared_state": json.dumps(shared_state)}
+
+    def load_database(self, records: Iterable[Any]) -> None:
+        """
+        Takes over the progress written into the database, which is at least as far as the one of the file.
+        :param records: Result of LOAD_CYPHER.
+        """
+        for file, activities, last_identifier, done, last_id, shared_state in records:
+            self.files[file] = {"activities": activities, "last_identifier": last_identifier, "done": done}
+            # The obj_ids and shared nodes of the latest commit.
+            if last_id >= self.last_id:
+                self.last_id = last_id
+                self.shared_state = json.loads(shared_state)
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,163 @@
+import json
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter, strftime, localtime
+from typing import Any, Dict, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# Counters of what is written, rather than read: "nodes:<class>", and the ones below.
+WRITTEN_COUNTER_PREFIX = "nodes:"
+WRITTEN_COUNTERS = {"statements", "commits"}
+
+
+class ImportMetrics:
+    """
+    Timers and counters of an import run. Stages are timed exclusively: the time of a stage started while another one
+    is running (e.g. a database round trip while rendering, when a batch is flushed) only counts for the inner stage.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        """
+        :param trace_memory: Record the peak memory per file with tracemalloc. This slows down allocations (so
+        everything else) considerably.
+        :type trace_memory: bool
+        """
+        self.trace_memory = trace_memory
+        self.started = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        self._start = perf_counter()
+        # stage -> [seconds, calls]
+        self.stages: Dict[str, List[float]] = dict()
+        # relation type -> [count, render seconds]
+        self.relations: Dict[str, List[float]] = dict()
+        self.counters: Dict[str, int] = dict()
+        self.files: Dict[str, Dict[str, Any]] = dict()
+        # [stage, relation, start, seconds of nested stages]
+        self._stack: List[list] = []
+        self._file: Dict[str, Any] = None
+
+    def start(self, stage: str, relation: str = None) -> None:
+        self._stack.append([stage, relation, perf_counter(), 0.0])
+
+    def stop(self) -> None:
+        stage, relation, start, nested = self._stack.pop()
+        elapsed = perf_counter() - start
+        timer = self.stages.get(stage)
+        if timer is None:
+            timer = self.stages[stage] = [0.0, 0]
+        timer[0] += elapsed - nested
+        timer[1] += 1
+        if relation is not None:
+            relation_timer = self.relations.get(relation)
+            if relation_timer is None:
+                relation_timer = self.relations[relation] = [0, 0.0]
+            relation_timer[0] += 1
+            relation_timer[1] += elapsed - nested
+        if len(self._stack) > 0:
+            self._stack[-1][3] += elapsed
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        self.start(stage)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed_iter(self, stage: str, iterable: Iterable[T]) -> Iterator[T]:
+        # Only the time spent getting the next item counts, not the time the caller spends on it.
+        iterator = iter(iterable)
+        while True:
+            self.start(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+            yield item
+
+    def add_time(self, stage: str, seconds: float, calls: int = 1) -> None:
+        # Time measured elsewhere, e.g. in another thread or process. It overlaps with the other stages.
+        timer = self.stages.setdefault(stage, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += calls
+
+    def count(self, counter: str, n: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def start_file(self, file: str, size: int) -> None:
+        """
+        :param file: XML file.
+        :param size: Size of the file in bytes, to estimate the remaining time from.
+        """
+        self._file = {"file": file, "bytes": size, "activities": 0, "start": perf_counter()}
+        if self.trace_memory:
+            tracemalloc.start()
+
+    def progress(self, activities: int, position: int) -> str:
+        """
+        :param activities: Activities of the current file handled so far.
+        :param position: Bytes of the current file read so far.
+        :return: Progress line with the rate and the estimated remaining time of the file.
+        :rtype: str
+        """
+        seconds = perf_counter() - self._file["start"]
+        fraction = position / self._file["bytes"] if self._file["bytes"] > 0 else 1.0
+        eta = seconds / fraction - seconds if fraction > 0 else 0.0
+        return "{} activities, {:.0f} activities/s, {:.1%} of the file, ETA {:.0f} s".format(
+            activities, activities / seconds if seconds > 0 else 0.0, fraction, eta)
+
+    def end_file(self, activities: int) -> None:
+        file = self._file.pop("file")
+        seconds = perf_counter() - self._file.pop("start")
+        self._file["activities"] = activities
+        self._file["seconds"] = seconds
+        self._file["activities_per_second"] = activities / seconds if seconds > 0 else 0.0
+        if self.trace_memory:
+            self._file["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.files[file] = self._file
+        self._file = None
+
+    def merge(self, other: "ImportMetrics", written: bool = True) -> None:
+        """
+        Adds the metrics of e.g. a worker process. Their times overlap with the ones of this process.
+        :param written: Also add the nodes, relations, statements and commits of other. False if they are written
+        (and counted) again by this process, like the recordings of the parallel workers.
+        :type written: bool
+        """
+        for stage, (seconds, calls) in other.stages.items():
+            self.add_time(stage, seconds, calls)
+        if written:
+            for relation, (count, seconds) in other.relations.items():
+                relation_timer = self.relations.setdefault(relation, [0, 0.0])
+                relation_timer[0] += count
+                relation_timer[1] += seconds
+        for counter, n in other.counters.items():
+            if written or not (counter.startswith(WRITTEN_COUNTER_PREFIX) or counter in WRITTEN_COUNTERS):
+                self.count(counter, n)
+        self.files.update(other.files)
+
+    def get_report(self, **extra: Any) -> Dict[str, Any]:
+        """
+        :param extra: Additional sections of the report, e.g. the registry statistics.
+        :return: Machine-readable report of the run so far.
+        :rtype: Dict[str, Any]
+        """
+        report = {
+            "started": self.started,
+            "seconds": perf_counter() - self._start,
+            "stages": {stage: {"seconds": seconds, "calls": calls}
+                       for stage, (seconds, calls) in self.stages.items()},
+            "relations": {relation: {"count": count, "render_seconds": seconds}
+                          for relation, (count, seconds) in self.relations.items()},
+            "counters": self.counters,
+            "files": self.files
+        }
+        report.update(extra)
+        return report
+
+    def save(self, path: str, **extra: Any) -> None:
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(self.get_report(**extra), f, indent=2)
@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Tuple
+
+# Direct relations are BELONGS_TO, the transitive closure (including the direct ones) is IN_REGION, so rolling a
+# location up to any region is a single hop.
+REGION_EDGE_TPL = "UNWIND $rows AS r " \
+                  "MATCH (c:Location {{code: r.code}}), (reg:Location {{code: r.region}}) " \
+                  "CREATE (c)-[:{} {{depth: r.depth}}]->(reg)"
+
+# Region code -> codes of the countries in it.
+country_region_map: Dict[int, List[str]] = {
+    189: [  # North Sahara
+        "DZ", "EG", "ER", "ET", "LY", "MA", "MR", "TN"
+    ], 289: [  # South Sahara
+        "AO", "BF", "BI", "BJ", "BW", "CD", "CF", "CG", "CI", "CM", "CV", "GH", "GN", "LR", "ML", "MW", "MZ",
+        "NA", "NE", "NG", "RW", "SD", "SL", "SN", "SO", "SS", "TD", "TZ", "UG", "ZA", "ZM", "ZW"
+    ], 298: [  # Africa
+    ], 389: [  # North/Central America
+        "CR", "CU", "DO", "GT", "HN", "HT", "KE", "MX", "NI", "PA", "SV", "VE"
+    ], 489: [  # South America
+        "AR", "BO", "BR", "CL", "CO", "EC", "PE", "PY", "SR", "UY"
+    ], 498: [  # America
+    ], 589: [  # Middle East
+        "IQ", "IR", "JO", "LB", "PS", "SY", "TR"
+    ], 619: [  # Central Asia
+        "KG", "KZ", "MN", "TJ", "YE"
+    ], 679: [  # South  Asia
+        "AF", "BD", "BT", "ID", "IN", "KH", "LA", "LK", "MM", "MY", "NP", "PH", "PK", "TH", "VN"
+    ], 789: [  # Far East Asia
+        "CN", "KP"
+    ], 798: [  # Asia
+    ], 89: [  # Europe
+        "AL", "AM", "AZ", "BA", "BY", "GE", "HR", "MD", "ME", "MK", "RS", "UA", "XK",
+    ], 998: [  # World Wide
+        "PG", "VU"  # Oceania
+    ]
+}
+
+# (region, region it is part of)
+other_belongings: List[Tuple[int, int]] = [
+    (189, 298), (289, 298), (389, 498), (489, 498), (589, 798), (619, 798), (679, 798), (789, 798),
+    (298, 998), (498, 998), (798, 998), (89, 998)
+]
+
+
+def get_parent_regions() -> Dict[str, List[str]]:
+    """
+    :return: Location code -> codes of the regions it directly belongs to, i.e. the BELONGS_TO relations.
+    :rtype: Dict[str, List[str]]
+    """
+    parents: Dict[str, List[str]] = dict()
+    for region_code, country_list in country_region_map.items():
+        for country_code in country_list:
+            parents.setdefault(str(country_code), []).append(str(region_code))
+    for region_code, master_region_code in other_belongings:
+        parents.setdefault(str(region_code), []).append(str(master_region_code))
+    return parents
+
+
+def get_region_closure() -> Dict[str, Dict[str, int]]:
+    """
+    Transitive closure of get_parent_regions(), e.g. 'ML' -> {'289': 1, '298': 2, '998': 3}.
+    :return: Location code -> {code of every region it belongs to, directly or not: number of BELONGS_TO hops}.
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    parents = get_parent_regions()
+    closure: Dict[str, Dict[str, int]] = dict()
+    for code in parents:
+        ancestors: Dict[str, int] = dict()
+        frontier = [code]
+        depth = 0
+        while len(frontier) > 0:
+            depth += 1
+            next_frontier = []
+            for child in frontier:
+                for parent in parents.get(child, []):
+                    if parent not in ancestors and parent != code:
+                        ancestors[parent] = depth
+                        next_frontier.append(parent)
+            frontier = next_frontier
+        closure[code] = ancestors
+    return closure
+
+
+def get_region_rows(transitive: bool) -> List[Dict[str, Any]]:
+    """
+    :param transitive: All (location, ancestor region) pairs instead of the direct ones only.
+    :return: Rows for REGION_EDGE_TPL: {"code": location code, "region": region code, "depth": hops}.
+    :rtype: List[Dict[str, Any]]
+    """
+    if not transitive:
+        return [{"code": code, "region": region, "depth": 1}
+                for code, regions in get_parent_regions().items() for region in regions]
+    return [{"code": code, "region": region, "depth": depth}
+            for code, ancestors in get_region_closure().items() for region, depth in ancestors.items()]
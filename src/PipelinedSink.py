@@ -0,0 +1,110 @@
+import queue
+import threading
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+try:
+    from WriteSink import WriteSink
+except ImportError:
+    from .WriteSink import WriteSink
+
+# Queue item ending the writer thread.
+_STOP = None
+
+
+class PipelinedSink(WriteSink):
+    """
+    Passes the statements on to another sink from a writer thread, so the caller can parse and render the next batches
+    while the previous ones are being executed (the database driver waits for the network without holding the GIL).
+    The calls are queued and executed in order. The queue is bounded: when the writer falls behind, run() blocks until
+    there is room again, so at most max_pending statements wait in memory.
+    If the writer fails, its error is raised by the next call of the caller, and the queued calls are dropped. If the
+    caller fails, the writer never receives the commit of the open transaction.
+    """
+
+    def __init__(self, sink: WriteSink, max_pending: int = 16):
+        """
+        :param sink: Sink executing the statements, used by the writer thread only.
+        :type sink: WriteSink
+        :param max_pending: Maximum number of queued calls.
+        :type max_pending: int
+        """
+        self.sink = sink
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._error: BaseException = None
+        # Seconds the writer spent in the sink, and the number of calls.
+        self.write_seconds = 0.0
+        self.writes = 0
+        # Seconds the caller waited for room in the queue.
+        self.wait_seconds = 0.0
+        self._thread = threading.Thread(target=self._write, name="PipelinedSink", daemon=True)
+        self._thread.start()
+
+    def _write(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if self._error is None:
+                    method, args = item
+                    start = perf_counter()
+                    method(*args)
+                    self.write_seconds += perf_counter() - start
+                    self.writes += 1
+            except BaseException as ex:
+                # Keep taking the calls from the queue, so the caller does not block on it forever.
+                self._error = ex
+            finally:
+                self._queue.task_done()
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, method: Callable[..., None], *args: Any) -> None:
+        self._check()
+        start = perf_counter()
+        self._queue.put((method, args))
+        self.wait_seconds += perf_counter() - start
+
+    def begin_transaction(self) -> None:
+        self._put(self.sink.begin_transaction)
+
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        self._put(self.sink.run, query, parameters)
+
+    def commit(self) -> None:
+        self._put(self.sink.commit)
+
+    def rollback(self) -> None:
+        self._put(self.sink.rollback)
+
+    def sync(self) -> None:
+        self._check()
+        self._queue.join()
+        self._check()
+
+    def run_autocommit(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        # Runs in the calling thread, so errors can be handled by the caller. The writer is idle after sync().
+        self.sync()
+        self.sink.run_autocommit(query, parameters)
+
+    def query(self, query: str, parameters: Dict[str, Any] = None) -> List[Any]:
+        self.sync()
+        return self.sink.query(query, parameters)
+
+    def stop(self) -> None:
+        """
+        Waits until all queued calls are executed and ends the writer thread, without closing the sink.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._check()
+
+    def close(self) -> None:
+        try:
+            self.stop()
+        finally:
+            self.sink.close()
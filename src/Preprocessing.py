@@ -1,13 +1,36 @@
-import xml.etree.ElementTree as ET
 import csv
+import os
+import shutil
+from multiprocessing import Pool
+from typing import Any, Callable, Dict, List, Tuple
+from xml.etree import ElementTree as ET
+
+try:
+    from ActivityReader import ActivityReader
+    from CompressedInput import get_input_name
+except ImportError:
+    from .ActivityReader import ActivityReader
+    from .CompressedInput import get_input_name
+
+XML_FILES = [
+    "../data/IATIACTIVITIES19972007.xml",
+    "../data/IATIACTIVITIES20082009.xml",
+    "../data/IATIACTIVITIES20102011.xml",
+    "../data/IATIACTIVITIES20122013.xml",
+    "../data/IATIACTIVITIES20142015.xml",
+    "../data/IATIACTIVITIES20162017.xml"
+]
+OUTPUT_FILE = "activities.csv"
+DELIMITER = " "
+WRITE_HEADER = False
+# Columns written for every activity, in this order. See COLUMN_SPEC for the available ones.
+COLUMNS = ["title", "description", "status"]
+# Number of worker processes, each extracting one file at a time; 0 extracts the files one after another in this one.
+WORKERS = 6
+# Keep one CSV file per XML file (activities_IATIACTIVITIES19972007.csv, ...) instead of joining them, in the order
+# of XML_FILES, into OUTPUT_FILE.
+SHARDED = False
 
-# Can also add the other files. I can't sync them yet
-tree9707 = ET.ElementTree(file='../data/IATIACTIVITIES19972007.xml')
-tree0809 = ET.ElementTree(file='../data/IATIACTIVITIES20082009.xml')
-tree1011 = ET.ElementTree(file='../data/IATIACTIVITIES20102011.xml')
-tree1213 = ET.ElementTree(file='../data/IATIACTIVITIES20122013.xml')
-tree1415 = ET.ElementTree(file='../data/IATIACTIVITIES20142015.xml')
-tree1617 = ET.ElementTree(file='../data/IATIACTIVITIES20162017.xml')
 # Important, a lot of the elements have a child named narrative/value containing the name/value under text
 
 # Find all names of several parts of the project
@@ -21,27 +44,98 @@ tree1617 = ET.ElementTree(file='../data/IATIACTIVITIES20162017.xml')
 # Policy marker (project): "//policy-marker"
 
 
-def write_activities(tree, writer):
-    for elem in tree.findall(".//iati-activity"):
-        writer.writerow([elem.find("title/narrative").text,
-                         elem.find("description/narrative").text,
-                         #elem.find("other-identifier").get("type"),
-                         elem.find("activity-status").get("code")])
+def get_text(path: str) -> Callable[[ET.Element], str]:
+    def extract(elem: ET.Element) -> str:
+        node = elem.find(path)
+        return node.text if node is not None else ""
+    return extract
+
+
+def get_attr(*paths: str, attr: str) -> Callable[[ET.Element], str]:
+    # The attribute of the first of the paths found.
+    def extract(elem: ET.Element) -> str:
+        for path in paths:
+            node = elem.find(path)
+            if node is not None:
+                return node.get(attr)
+        return ""
+    return extract
+
+
+# Column name -> value of an 'iati-activity' element. Dates are the actual ones if known, else the planned ones.
+COLUMN_SPEC: Dict[str, Callable[[ET.Element], Any]] = {
+    "identifier": get_text("iati-identifier"),
+    "title": get_text("title/narrative"),
+    "description": get_text("description/narrative"),
+    "status": get_attr("activity-status", attr="code"),
+    "start_date": get_attr("activity-date[@type='2']", "activity-date[@type='1']", attr="iso-date"),
+    "end_date": get_attr("activity-date[@type='4']", "activity-date[@type='3']", attr="iso-date"),
+    "budget_value": get_text("budget/value"),
+    "recipient": get_attr("recipient-country", "recipient-region", attr="code")
+}
+
+
+def get_shard_path(output: str, file: str) -> str:
+    name, ext = os.path.splitext(output)
+    return "{}_{}{}".format(name, get_input_name(file), ext)
 
-with open('activities.csv', 'w', newline='') as csvfile:
-    writer = csv.writer(csvfile, delimiter=' ',
-                            quotechar='"', quoting=csv.QUOTE_MINIMAL)
 
-    write_activities(tree9707, writer)
-    write_activities(tree0809, writer)
-    write_activities(tree1011, writer)
-    write_activities(tree1213, writer)
-    write_activities(tree1415, writer)
-    write_activities(tree1617, writer)
+def open_csv(path: str, mode: str = "w"):
+    return open(path, mode, newline="", encoding="utf8")
 
 
+def extract_file(job: Tuple[str, str, List[str], bool]) -> int:
+    # Runs in a worker process. Streams one XML file into one CSV file, so the memory use does not grow with the file.
+    file, path, columns, header = job
+    extractors = [COLUMN_SPEC[column] for column in columns]
+    count = 0
+    with open_csv(path) as csvfile:
+        writer = csv.writer(csvfile, delimiter=DELIMITER, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        if header:
+            writer.writerow(columns)
+        for elem in ActivityReader.iter_activities(file):
+            writer.writerow([extract(elem) for extract in extractors])
+            count += 1
+    return count
 
 
+def extract_files(files: List[str], output: str, columns: List[str], workers: int = 0, sharded: bool = False) \
+        -> List[str]:
+    """
+    :param files: IATI XML files.
+    :param output: CSV file, or the name the shards are derived from.
+    :param columns: Names of the columns, keys of COLUMN_SPEC.
+    :param workers: Number of worker processes; 0 extracts the files in this process.
+    :param sharded: Keep one CSV file per XML file instead of joining them into the output file.
+    :return: Written CSV files.
+    :rtype: List[str]
+    """
+    for column in columns:
+        if column not in COLUMN_SPEC:
+            raise ValueError("Unknown column '{}', choose from {}".format(column, list(COLUMN_SPEC.keys())))
+    shards = [get_shard_path(output, file) for file in files]
+    jobs = [(file, shard, columns, WRITE_HEADER and sharded) for file, shard in zip(files, shards)]
+    if workers > 0:
+        with Pool(workers) as pool:
+            counts = pool.map(extract_file, jobs)
+    else:
+        counts = [extract_file(job) for job in jobs]
+    for file, count in zip(files, counts):
+        print("{}: {} activities".format(file, count))
+    if sharded:
+        return shards
 
+    # Join the shards in file order, chunk by chunk.
+    with open_csv(output) as csvfile:
+        if WRITE_HEADER:
+            csv.writer(csvfile, delimiter=DELIMITER, quotechar='"', quoting=csv.QUOTE_MINIMAL).writerow(columns)
+        for shard in shards:
+            with open_csv(shard, "r") as shard_file:
+                shutil.copyfileobj(shard_file, csvfile)
+            os.remove(shard)
+    return [output]
 
 
+if __name__ == '__main__':
+    for path in extract_files(XML_FILES, OUTPUT_FILE, COLUMNS, WORKERS, SHARDED):
+        print("Written '{}'".format(path))
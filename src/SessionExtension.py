@@ -1,173 +1,267 @@
-from typing import List
-from xml.etree import ElementTree as ET
-import neo4j.v1 as neo
+from typing import Any, Dict, List, Union
 
 try:
     # The main module must import files from the same directory in this way, but PyCharm just can't recognize it.
     # http://stackoverflow.com/questions/41816973/modulenotfounderror-what-does-it-mean-main-is-not-a-package
-    from CypherStatementBuilder import CypherStatementBuilder as Stmt
+    from CypherStatementBuilder import CypherStatementBuilder as Stmt, CompiledStatement
     from Entities import *
+    from BatchWriter import BatchWriter, UpsertBatchWriter
+    from EntityRegistry import EntityRegistry
+    from WriteSink import WriteSink
+    from ImportMetrics import ImportMetrics
 except ImportError:
     # So do a trick, use the standard Python 3 import syntax to feed PyCharm's intellisense.
-    from .CypherStatementBuilder import CypherStatementBuilder as Stmt
+    from .CypherStatementBuilder import CypherStatementBuilder as Stmt, CompiledStatement
     from .Entities import *
+    from .BatchWriter import BatchWriter, UpsertBatchWriter
+    from .EntityRegistry import EntityRegistry
+    from .WriteSink import WriteSink
+    from .ImportMetrics import ImportMetrics
 
 
 class SessionExtension:
-    _session: neo.Session = None
-    _transaction: neo.Transaction = None
-    _known_org_refs: List[str] = []
-    _known_orgs: List[Organization] = []
-    _added_org_refs: List[str] = []
-    _known_location_codes: List[str] = []
-    _known_locations: List[Location] = []
-    _added_location_codes: List[str] = []
-    _known_policy_codes: List[int] = []
-    _known_policies: List[Policy] = []
-    _added_policy_codes: List[int] = []
-
-    def __init__(self, session: neo.Session):
-        self._session = session
-
-    @staticmethod
-    def narrative(node: ET.Element) -> str:
-        return node.find("narrative").text
+    _sink: WriteSink = None
+    _writer: Union[BatchWriter, Any] = None
+    metrics: ImportMetrics = None
+    _organizations: EntityRegistry[Organization]
+    _policies: EntityRegistry[Policy]
+    _locations: EntityRegistry[Location]
+
+    def __init__(self, sink: WriteSink, batch_size: int = 0, writer: Any = None, metrics: ImportMetrics = None,
+                 upsert_keys: Dict[str, str] = None):
+        """
+        :param sink: Sink all statements are sent to (BoltSink, CypherFileSink, RecordingSink). May be None if a
+        writer handles all output.
+        :type sink: WriteSink
+        :param batch_size: If positive, nodes and edges are buffered and written as parameterized batches of this
+        size. Otherwise every node and edge is written by its own literal statement.
+        :type batch_size: int
+        :param writer: Object with the add_node/add_edge/flush/clear methods of BatchWriter (e.g. AdminCsvWriter)
+        receiving all nodes and edges instead of the sink.
+        :param metrics: If given, rendering and database round trips are timed, and statements, nodes and edges are
+        counted.
+        :type metrics: ImportMetrics
+        :param upsert_keys: Node class -> property identifying a shared node of that class. If given, those nodes are
+        MERGEd on it instead of created, so several processes can write into the same database (see
+        UpsertBatchWriter). Needs a positive batch_size.
+        :type upsert_keys: Dict[str, str]
+        """
+        self._sink = sink
+        # Statement shape -> prepared statement, for the literal (unbatched) statements.
+        self._compiled: Dict[tuple, CompiledStatement] = dict()
+        self._organizations = EntityRegistry("Organization")
+        self._policies = EntityRegistry("Policy")
+        self._locations = EntityRegistry("Location")
+        if writer is not None:
+            self._writer = writer
+        elif upsert_keys is not None:
+            if batch_size <= 0:
+                raise ValueError("Upserting shared nodes needs a positive batch_size")
+            self._writer = UpsertBatchWriter(self.run, batch_size, upsert_keys, self._get_partitions())
+        elif batch_size > 0:
+            self._writer = BatchWriter(self.run, batch_size, self._get_partitions(),
+                                       [registry.name for registry in self._get_registries()])
+        self.metrics = metrics
 
     def begin_transaction(self) -> None:
-        if self._transaction is not None:
-            return
-        self._transaction = self._session.begin_transaction()
+        if self._sink is not None:
+            self._sink.begin_transaction()
 
     def commit(self) -> None:
-        self._transaction.commit()
-        self._transaction.close()
-        self._transaction = None
+        if self._writer is not None:
+            self._writer.flush()
+        if self._sink is not None:
+            self._sink.commit()
 
     def rollback(self) -> None:
-        self._transaction.rollback()
-        self._transaction.close()
-        self._transaction = None
+        if self._writer is not None:
+            self._writer.clear()
+        if self._sink is not None:
+            self._sink.rollback()
+
+    def sync(self) -> None:
+        if self._sink is not None:
+            self._sink.sync()
 
-    def run(self, query: str) -> None:
-        self._transaction.run(query)
+    def _get_partitions(self) -> int:
+        return self._sink.partitions if self._sink is not None else 1
+
+    def _get_registries(self) -> List[EntityRegistry]:
+        return [self._organizations, self._policies, self._locations]
+
+    def run(self, query: str, parameters: Dict[str, Any] = None, partition: int = None) -> None:
+        if self.metrics is not None:
+            self.metrics.start("db_round_trip")
+        if partition is None:
+            self._sink.run(query, parameters)
+        else:
+            self._sink.run_partition(partition, query, parameters)
+        if self.metrics is not None:
+            self.metrics.stop()
+            self.metrics.count("statements")
 
     def run_session(self, query: str) -> None:
-        self._session.run(query)
-
-    def get_activity(self, node: ET.Element) -> Activity:
-        ident_node: ET.Element = node.find("iati-identifier")
-        identifier: str = ident_node.text
-        desc_node: ET.Element = node.find("description")
-        description: str = SessionExtension.narrative(desc_node)
-        title_node: ET.Element = node.find("title")
-        title: str = SessionExtension.narrative(title_node)
-        status_node: ET.Element = node.find("activity-status")
-        status: int = int(status_node.get("code"))
-        dates: List[Activity.ActivityDate] = []
-        for act_date_node in node.iter("activity-date"):
-            dates.append(Activity.ActivityDate(int(act_date_node.get("type")), act_date_node.get("iso-date")))
-        return Activity(identifier, description, status, title, dates)
+        self._sink.run_autocommit(query)
+
+    def query(self, query: str, parameters: Dict[str, Any] = None) -> List[Any]:
+        return self._sink.query(query, parameters)
+
+    def add_node(self, node_name: str, class_name: str, props: Union[dict, None] = None) -> None:
+        if self.metrics is None:
+            self._add_node(node_name, class_name, props)
+            return
+        self.metrics.start("render")
+        self._add_node(node_name, class_name, props)
+        self.metrics.stop()
+        self.metrics.count("nodes:" + class_name)
+
+    def add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                 edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        if self.metrics is None:
+            self._add_edge(n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique)
+            return
+        self.metrics.start("render", edge_class.upper())
+        self._add_edge(n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique)
+        self.metrics.stop()
+
+    def add_flows(self, activity: Activity, budget: Budget, transactions: List[Transaction],
+                  disbursements: List[Disbursement]) -> None:
+        """
+        Passes the transactions and planned disbursements of an activity themselves to writers keeping them apart
+        from the TRANSACTS and PLANS_DISBURSEMENT relations (keeps_flows, like ColumnarWriter), one row each.
+        """
+        if not getattr(self._writer, "keeps_flows", False):
+            return
+        self._writer.add_flows(activity.obj_id, budget.obj_id, [
+            (t.type, t.date, t.value,
+             t.provider_org.obj_id if t.provider_org is not None else -1,
+             t.receiver_org.obj_id if t.receiver_org is not None else -1,
+             Organization.get_unique_ref(t.provider_name, t.provider_ref),
+             Organization.get_unique_ref(t.receiver_name, t.receiver_ref)) for t in transactions
+        ], [(d.period_start, d.period_end, d.value) for d in disbursements])
+
+    def add_flow_rows(self, activity_id: int, budget_id: int, transactions: List[tuple],
+                      disbursements: List[tuple]) -> None:
+        # Rows recorded by a RecordingWriter, see add_flows.
+        if getattr(self._writer, "keeps_flows", False):
+            self._writer.add_flows(activity_id, budget_id, transactions, disbursements)
+
+    def _add_node(self, node_name: str, class_name: str, props: Union[dict, None] = None) -> None:
+        if self._writer is not None:
+            self._writer.add_node(class_name, props)
+            return
+        props = props if props is not None else dict()
+        key = (class_name, tuple(props.keys()))
+        stmt = self._compiled.get(key)
+        if stmt is None:
+            stmt = self._compiled[key] = Stmt.compile_node(class_name, key[1])
+        self.run(stmt.render((node_name,), props.values()))
+
+    def _add_edge(self, n1_class: str, n1_id: int, n2_class: str, n2_id: int, edge_class: str,
+                  edge_props: Union[dict, None] = None, is_unique: bool = False) -> None:
+        if self._writer is not None:
+            self._writer.add_edge(n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique)
+            return
+        edge_props = edge_props if edge_props is not None else dict()
+        key = (n1_class, n2_class, edge_class, tuple(edge_props.keys()), is_unique)
+        stmt = self._compiled.get(key)
+        if stmt is None:
+            stmt = self._compiled[key] = Stmt.compile_edge_by_ids("n1", n1_class, "n2", n2_class, edge_class, key[3],
+                                                                  is_unique=is_unique)
+        self.run(stmt.render((n1_id, n2_id), edge_props.values()))
 
     def add_activity(self, activity: Activity) -> int:
-        stmt = Stmt.create_node(activity.get_name(), "Activity", {
+        self.add_node(activity.get_name(), "Activity", {
             "identifier": activity.identifier, "description": activity.description, "title": activity.title,
-            "status": activity.status,
+            "status": activity.status, "content_hash": activity.content_hash,
             "obj_id": activity.obj_id
         })
-        self._transaction.run(stmt)
         return activity.obj_id
 
-    def get_budget(self, node: ET.Element, parent_activity: Activity) -> Budget:
-        period_start: str = node.find("period-start").get("iso-date")
-        period_end: str = node.find("period-end").get("iso-date")
-        value: int = int(node.find("value").text)
-        # http://iatistandard.org/202/activity-standard/iati-activities/iati-activity/budget/
-        ty: int = int(node.get("type")) if node.get("type") is not None else 0
-        status: int = int(node.get("status")) if node.get("status") is not None else 1
-        return Budget(period_start, period_end, value, ty, status, parent_activity)
-
     def add_budget(self, budget: Budget) -> int:
         # Budget naming: bud_{$activity_ident}
-        stmt = Stmt.create_node(budget.get_name(), "Budget", {
+        self.add_node(budget.get_name(), "Budget", {
             "value": budget.value,
             "obj_id": budget.obj_id
         })
-        self._transaction.run(stmt)
         return budget.obj_id
 
-    def get_organization(self, node: ET.Element) -> Organization:
-        name: str = SessionExtension.narrative(node)
-        ref: str = node.get("ref")
-        ty: int = int(node.get("type"))
+    def make_organization(self, name: str, ref: str, ty: int) -> Organization:
+        # The known organization with this (unique) ref, else a new one.
         ref = Organization.get_unique_ref(name, ref)
-        if ref in self._added_org_refs:
-            index = self._known_org_refs.index(ref)
-            org: Organization = self._known_orgs[index]
-            return org
-        organization = Organization(name, ref, ty)
-        self._known_org_refs.append(organization.ref)
-        self._known_orgs.append(organization)
-        return organization
+        return self._organizations.get_or_create(ref, lambda: Organization(name, ref, ty))
 
     def add_organization(self, org: Organization) -> int:
-        if org.ref in self._added_org_refs:
-            index = self._known_org_refs.index(org.ref)
-            org: Organization = self._known_orgs[index]
-            return org.obj_id
-        self._added_org_refs.append(org.ref)
-        stmt = Stmt.create_node(org.get_name(), "Organization", {
+        if not self._organizations.mark_written(org.ref):
+            return self._organizations.get(org.ref, org).obj_id
+        self.add_node(org.get_name(), "Organization", {
             "name": org.name, "ref": org.ref, "type": org.type,
             "obj_id": org.obj_id
         })
-        self._transaction.run(stmt)
         return org.obj_id
 
-    def get_policy(self, node: ET.Element) -> Policy:
-        code: int = int(node.get("code"))
-        name: str = SessionExtension.narrative(node)
-        if code in self._added_policy_codes:
-            index = self._added_policy_codes.index(code)
-            pol: Policy = self._known_policies[index]
-            return pol
-        policy = Policy(name, code)
-        self._known_policy_codes.append(policy.code)
-        self._known_policies.append(policy)
-        return policy
+    def make_policy(self, code: int, name: str) -> Policy:
+        return self._policies.get_or_create(code, lambda: Policy(name, code))
 
     def add_policy(self, policy: Policy) -> int:
-        if policy.code in self._added_policy_codes:
-            index = self._known_policy_codes.index(policy.code)
-            pol: Policy = self._known_policies[index]
-            return pol.obj_id
-        self._added_policy_codes.append(policy.code)
-        stmt = Stmt.create_node(policy.get_name(), "Policy", {
+        if not self._policies.mark_written(policy.code):
+            return self._policies.get(policy.code, policy).obj_id
+        self.add_node(policy.get_name(), "Policy", {
             "name": policy.name, "code": policy.code,
             "obj_id": policy.obj_id
         })
-        self._transaction.run(stmt)
         return policy.obj_id
 
-    def get_location(self, node: ET.Element) -> Location:
-        code: str = node.get("code")
-        if code in self._added_location_codes:
-            index = self._known_location_codes.index(code)
-            loc: Location = self._known_locations[index]
-            return loc
-        name = SessionExtension.narrative(node)
-        location = Location(code, name)
-        self._known_location_codes.append(location.code)
-        self._known_locations.append(location)
-        return location
+    def make_location(self, code: str, name: str) -> Location:
+        return self._locations.get_or_create(code, lambda: Location(code, name))
 
     def add_location(self, location: Location) -> int:
-        if location.code in self._added_location_codes:
-            index = self._known_location_codes.index(location.code)
-            loc: Location = self._known_locations[index]
-            return loc.obj_id
-        self._added_location_codes.append(location.code)
-        stmt = Stmt.create_node(location.get_name(), "Location", {
+        if not self._locations.mark_written(location.code):
+            return self._locations.get(location.code, location).obj_id
+        self.add_node(location.get_name(), "Location", {
             "code": location.code, "name": location.name,
             "obj_id": location.obj_id
         })
-        self._transaction.run(stmt)
         return location.obj_id
+
+    def get_shared_state(self) -> Dict[str, List[list]]:
+        # The written organizations, policies and locations, as JSON-friendly lists.
+        return {
+            "Organization": [[org.name, org.ref, org.type, org.obj_id] for org in self._organizations
+                             if self._organizations.is_written(org.ref)],
+            "Policy": [[pol.name, pol.code, pol.obj_id] for pol in self._policies
+                       if self._policies.is_written(pol.code)],
+            "Location": [[loc.code, loc.name, loc.obj_id] for loc in self._locations
+                         if self._locations.is_written(loc.code)]
+        }
+
+    def restore_shared_state(self, state: Dict[str, List[list]]) -> None:
+        # Inverse of get_shared_state(). Restored entities count as written, they are in the database already.
+        for name, ref, ty, obj_id in state.get("Organization", []):
+            org = Organization(name, ref, ty)
+            org.obj_id = obj_id
+            self._organizations.add(ref, org, written=True)
+        for name, code, obj_id in state.get("Policy", []):
+            pol = Policy(name, code)
+            pol.obj_id = obj_id
+            self._policies.add(code, pol, written=True)
+        for code, name, obj_id in state.get("Location", []):
+            loc = Location(code, name)
+            loc.obj_id = obj_id
+            self._locations.add(code, loc, written=True)
+
+    def load_shared_state(self) -> None:
+        # Like restore_shared_state(), but from the nodes in the database.
+        self.restore_shared_state({
+            "Organization": [list(r) for r in self.query(
+                "MATCH (n:Organization) RETURN n.name, n.ref, n.type, n.obj_id")],
+            "Policy": [list(r) for r in self.query("MATCH (n:Policy) RETURN n.name, n.code, n.obj_id")],
+            "Location": [list(r) for r in self.query("MATCH (n:Location) RETURN n.code, n.name, n.obj_id")]
+        })
+
+    def get_max_obj_id(self) -> int:
+        records = self.query("MATCH (n) RETURN max(n.obj_id)")
+        return records[0][0] or 0
+
+    def registry_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {registry.name: registry.stats() for registry in self._get_registries()}
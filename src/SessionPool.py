@@ -0,0 +1,128 @@
+from typing import Any, Dict, List
+
+try:
+    from WriteSink import WriteSink
+    from PipelinedSink import PipelinedSink
+except ImportError:
+    from .WriteSink import WriteSink
+    from .PipelinedSink import PipelinedSink
+
+
+class SessionPool(WriteSink):
+    """
+    Writes through several sinks (e.g. BoltSinks of different sessions of one driver) at the same time, each one from
+    its own writer thread (PipelinedSink). Statements of partition i run in sink i; other statements, like the node
+    batches, run in the first sink.
+    The sinks have transactions of their own, so the others do not see the nodes the first one has created until it
+    commits. Therefore the first partitioned statement after other statements commits the first sink and waits for it.
+    A commit commits all sinks, but not atomically: if one of them fails, the others may have committed already.
+    """
+
+    def __init__(self, sinks: List[WriteSink], max_pending: int = 16):
+        """
+        :param sinks: One sink per partition.
+        :type sinks: List[WriteSink]
+        :param max_pending: Maximum number of queued calls per sink.
+        :type max_pending: int
+        """
+        self.sinks = sinks
+        self.partitions = len(sinks)
+        self._pipelines = [PipelinedSink(sink, max_pending) for sink in sinks]
+        # Statements and rows per partition; the unpartitioned statements count for partition 0.
+        self._statements = [0] * len(sinks)
+        self._rows = [0] * len(sinks)
+        # The first sink has run statements the partitions may depend on, since its last commit.
+        self._unshared = False
+
+    @property
+    def write_seconds(self) -> float:
+        return sum(pipeline.write_seconds for pipeline in self._pipelines)
+
+    @property
+    def writes(self) -> int:
+        return sum(pipeline.writes for pipeline in self._pipelines)
+
+    @property
+    def wait_seconds(self) -> float:
+        return sum(pipeline.wait_seconds for pipeline in self._pipelines)
+
+    def begin_transaction(self) -> None:
+        for pipeline in self._pipelines:
+            pipeline.begin_transaction()
+
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        self._pipelines[0].run(query, parameters)
+        self._statements[0] += 1
+        self._rows[0] += len(parameters.get("rows", ())) if parameters else 0
+        self._unshared = True
+
+    def run_partition(self, partition: int, query: str, parameters: Dict[str, Any] = None) -> None:
+        if self._unshared:
+            first = self._pipelines[0]
+            first.commit()
+            first.sync()
+            first.begin_transaction()
+            self._unshared = False
+        self._pipelines[partition].run(query, parameters)
+        self._statements[partition] += 1
+        self._rows[partition] += len(parameters.get("rows", ())) if parameters else 0
+
+    def commit(self) -> None:
+        # The sinks commit at the same time, then wait for all of them.
+        for pipeline in self._pipelines:
+            pipeline.commit()
+        self.sync()
+        self._unshared = False
+
+    def rollback(self) -> None:
+        for pipeline in self._pipelines:
+            pipeline.rollback()
+        self.sync()
+        self._unshared = False
+
+    def sync(self) -> None:
+        for pipeline in self._pipelines:
+            pipeline.sync()
+
+    def run_autocommit(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        self.sync()
+        self._pipelines[0].run_autocommit(query, parameters)
+
+    def query(self, query: str, parameters: Dict[str, Any] = None) -> List[Any]:
+        self.sync()
+        return self._pipelines[0].query(query, parameters)
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        :return: Per sink: statements, rows, seconds spent writing, rows per second, and the retries and deadlocks of
+        a BoltSink.
+        :rtype: List[Dict[str, Any]]
+        """
+        return [{
+            "statements": statements,
+            "rows": rows,
+            "write_seconds": pipeline.write_seconds,
+            "rows_per_second": rows / pipeline.write_seconds if pipeline.write_seconds > 0 else 0.0,
+            "retries": getattr(pipeline.sink, "retried", 0),
+            "deadlocks": getattr(pipeline.sink, "deadlocks", 0)
+        } for pipeline, statements, rows in zip(self._pipelines, self._statements, self._rows)]
+
+    def stop(self) -> None:
+        """
+        Waits until all queued calls are executed and ends the writer threads, without closing the sinks.
+        """
+        errors = []
+        for pipeline in self._pipelines:
+            try:
+                pipeline.stop()
+            except Exception as ex:
+                errors.append(ex)
+        if len(errors) > 0:
+            raise errors[0]
+
+    def close(self) -> None:
+        try:
+            self.stop()
+        finally:
+            for sink in self.sinks:
+                sink.close()
@@ -0,0 +1,201 @@
+import gzip
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, TextIO, Tuple
+
+try:
+    from CypherStatementBuilder import get_escaped_str
+except ImportError:
+    from .CypherStatementBuilder import get_escaped_str
+
+PARAMETER_RE = re.compile(r"\$(\w+)")
+
+
+def get_literal(value: Any) -> str:
+    # Cypher literal of a statement parameter: like get_escaped_str, but also for maps (the rows of a batch).
+    if isinstance(value, dict):
+        return "{" + ", ".join([str(k) + ":" + get_literal(v) for k, v in value.items()]) + "}"
+    elif isinstance(value, list):
+        return "[" + ", ".join([get_literal(item) for item in value]) + "]"
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    return get_escaped_str(value)
+
+
+def inline_parameters(query: str, parameters: Dict[str, Any] = None) -> str:
+    if not parameters:
+        return query
+    return PARAMETER_RE.sub(lambda match: get_literal(parameters[match.group(1)]), query)
+
+
+class WriteSink(ABC):
+    """
+    Destination of the statements of a SessionExtension. Writes go through begin_transaction / run / commit, in the
+    way of a neo.Session; query is only answered by sinks backed by a database.
+    """
+    # Sinks running statements in parallel (SessionPool) have more than one partition.
+    partitions = 1
+
+    @abstractmethod
+    def begin_transaction(self) -> None:
+        """
+        Starts a transaction, unless one is open already.
+        """
+
+    @abstractmethod
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        """
+        Runs a statement in the open transaction.
+        """
+
+    def run_partition(self, partition: int, query: str, parameters: Dict[str, Any] = None) -> None:
+        """
+        Runs a statement of one partition. Statements of different partitions may run concurrently, in different
+        transactions.
+        """
+        self.run(query, parameters)
+
+    @abstractmethod
+    def commit(self) -> None:
+        """
+        Commits the open transaction, if any.
+        """
+
+    @abstractmethod
+    def rollback(self) -> None:
+        """
+        Discards the open transaction, if any.
+        """
+
+    def run_autocommit(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        """
+        Runs a statement in a transaction of its own, e.g. a schema change (which cannot share a transaction with
+        writes).
+        """
+        self.begin_transaction()
+        self.run(query, parameters)
+        self.commit()
+
+    def sync(self) -> None:
+        """
+        Waits until all statements passed so far have been executed. Sinks executing them right away do nothing.
+        """
+        pass
+
+    def query(self, query: str, parameters: Dict[str, Any] = None) -> List[Any]:
+        """
+        :return: Records of a read statement. Sinks without a database return nothing.
+        :rtype: List[Any]
+        """
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+class CypherFileSink(WriteSink):
+    """
+    Writes the statements to a Cypher script instead of a database, to be run later with e.g.
+    'cypher-shell < import.cypher'. Every transaction is enclosed by ':begin' / ':commit', and parameters are inlined
+    as literals, so a batched import (SessionExtension with batch_size > 0) gives one 'UNWIND [...]' line per batch.
+    """
+
+    def __init__(self, path: str, compress: bool = False):
+        """
+        :param path: Script file, '.gz' is appended if compressed.
+        :type path: str
+        :param compress: Write a gzip compressed script.
+        :type compress: bool
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if compress:
+            self.path = path + ".gz"
+            self._file: TextIO = gzip.open(self.path, "wt", encoding="utf8")
+        else:
+            self.path = path
+            self._file: TextIO = open(self.path, "w", encoding="utf8")
+        self._in_transaction = False
+        self.statements = 0
+
+    def begin_transaction(self) -> None:
+        if not self._in_transaction:
+            self._file.write(":begin\n")
+            self._in_transaction = True
+
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        self._file.write(inline_parameters(query, parameters).rstrip(";") + ";\n")
+        self.statements += 1
+
+    def commit(self) -> None:
+        if self._in_transaction:
+            self._file.write(":commit\n")
+            self._in_transaction = False
+
+    def rollback(self) -> None:
+        if self._in_transaction:
+            self._file.write(":rollback\n")
+            self._in_transaction = False
+
+    def close(self) -> None:
+        self.commit()
+        self._file.close()
+
+
+class RecordingSink(WriteSink):
+    """
+    Keeps the committed transactions in memory, or only counts them. Measures parsing and transformation without a
+    database, and the recorded workload can be replayed into another sink.
+    """
+
+    def __init__(self, keep: bool = True):
+        """
+        :param keep: Keep the statements; if False, only the counters are updated.
+        :type keep: bool
+        """
+        self.keep = keep
+        # Committed transactions, each a list of (query, parameters).
+        self.transactions: List[List[Tuple[str, Dict[str, Any]]]] = []
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._in_transaction = False
+        self.statements = 0
+        self.statement_chars = 0
+        self.rows = 0
+        self.commits = 0
+
+    def begin_transaction(self) -> None:
+        self._in_transaction = True
+
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        self.statements += 1
+        self.statement_chars += len(query)
+        if parameters is not None and "rows" in parameters:
+            self.rows += len(parameters["rows"])
+        if self.keep:
+            self._pending.append((query, parameters))
+
+    def commit(self) -> None:
+        if not self._in_transaction:
+            return
+        self._in_transaction = False
+        self.commits += 1
+        if self.keep:
+            self.transactions.append(self._pending)
+            self._pending = []
+
+    def rollback(self) -> None:
+        self._in_transaction = False
+        self._pending = []
+
+    def get_counts(self) -> Dict[str, int]:
+        return {"statements": self.statements, "statement_chars": self.statement_chars, "rows": self.rows,
+                "commits": self.commits}
+
+    def replay(self, sink: WriteSink) -> None:
+        for transaction in self.transactions:
+            sink.begin_transaction()
+            for query, parameters in transaction:
+                sink.run(query, parameters)
+            sink.commit()
@@ -0,0 +1,229 @@
+import json
+import os
+import platform
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter, sleep, strftime
+from typing import Any, Callable, Dict, List, TextIO, Tuple
+from xml.etree import ElementTree as ET
+
+try:
+    from CypherStatementBuilder import CypherStatementBuilder as Stmt
+    from Entities import *
+    from SessionExtension import SessionExtension
+    from ActivityReader import ActivityReader
+    from ActivityExtractor import ActivityExtractor
+    from BatchWriter import RecordingWriter
+    from syntheticIati import generate_iati
+    from WriteSink import RecordingSink
+    from PipelinedSink import PipelinedSink
+    import importToNeo4j
+except ImportError:
+    from .CypherStatementBuilder import CypherStatementBuilder as Stmt
+    from .Entities import *
+    from .SessionExtension import SessionExtension
+    from .ActivityReader import ActivityReader
+    from .ActivityExtractor import ActivityExtractor
+    from .BatchWriter import RecordingWriter
+    from .syntheticIati import generate_iati
+    from .WriteSink import RecordingSink
+    from .PipelinedSink import PipelinedSink
+    from . import importToNeo4j
+
+# Input of the benchmark, generated if it does not exist yet.
+BENCH_FILE = "../data/IATIACTIVITIES_BENCHMARK.xml"
+BENCH_CONFIG = {"activities": 5000, "transactions": 5, "disbursements": 2, "orgs": 200, "policy_markers": 3,
+                "seed": 0}
+# Few activities with hundreds of transactions and many partners each, for the relation building.
+LARGE_FILE = "../data/IATIACTIVITIES_BENCHMARK_LARGE.xml"
+LARGE_CONFIG = {"activities": 200, "transactions": 500, "disbursements": 20, "orgs": 200, "policy_markers": 3,
+                "partners": 60, "seed": 0}
+BENCH_BATCH_SIZE = 1000
+# Simulated database round trip of every statement and commit, in seconds, for the pipelined write stages.
+BENCH_LATENCY = 0.005
+BENCH_QUEUE_SIZE = 16
+RESULT_FILE = "benchmark_results.json"
+
+
+class LatencySink(RecordingSink):
+    # Counts the statements like RecordingSink, and waits for each one like a database over the network.
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> None:
+        sleep(BENCH_LATENCY)
+        super().run(query, parameters)
+
+    def commit(self) -> None:
+        sleep(BENCH_LATENCY)
+        super().commit()
+
+
+def time_stage(results: Dict[str, Any], name: str, func: Callable[[], Tuple[int, Dict[str, Any]]]) -> None:
+    # func returns the number of items it handled, and any extra numbers worth reporting.
+    print("Running stage '{}'...".format(name))
+    reset_next_id()
+    start = perf_counter()
+    items, extra = func()
+    seconds = perf_counter() - start
+    results[name] = dict({"seconds": seconds, "items": items, "items_per_second": items / seconds}, **extra)
+
+
+def stage_extract(nodes: List[ET.Element], extractor: ActivityExtractor) -> Tuple[int, Dict[str, Any]]:
+    start = perf_counter()
+    values = 0
+    for node in nodes:
+        record = extractor.extract(node)
+        values += len(record.participating_orgs) + len(record.policy_markers) + len(record.transactions) + \
+            len(record.disbursements)
+    return len(nodes), {"values": values, "us_per_activity": (perf_counter() - start) / len(nodes) * 10 ** 6}
+
+
+def time_stage_extract(results: Dict[str, Any], suffix: str, nodes: List[ET.Element]) -> None:
+    # Reading all fields of an activity, without and with its content hash (delta imports), which is also timed on its
+    # own.
+    def stage_hash():
+        start = perf_counter()
+        for node in nodes:
+            ActivityExtractor.get_content_hash(node)
+        return len(nodes), {"us_per_activity": (perf_counter() - start) / len(nodes) * 10 ** 6}
+
+    time_stage(results, "content_hash" + suffix, stage_hash)
+    time_stage(results, "extract" + suffix, lambda: stage_extract(nodes, ActivityExtractor()))
+    time_stage(results, "extract_with_hash" + suffix, lambda: stage_extract(nodes, ActivityExtractor(True)))
+
+
+def run_benchmark(file: str, devnull: TextIO) -> Dict[str, Any]:
+    # The output of the importer goes to devnull.
+    results: Dict[str, Any] = dict()
+
+    time_stage(results, "parse_streaming",
+               lambda: (sum(1 for _ in ActivityReader.iter_activities(file, True)), dict()))
+    time_stage(results, "parse_tree", lambda: (sum(1 for _ in ActivityReader.iter_activities(file, False)), dict()))
+
+    # The stages below work on a parsed tree, so they do not include parsing.
+    nodes = list(ActivityReader.iter_activities(file, False))
+    time_stage_extract(results, "", nodes)
+    # The entities and relations of importToNeo4j, recorded instead of written.
+    records = [ActivityExtractor().extract(node) for node in nodes]
+    ext = SessionExtension(None, writer=RecordingWriter())
+    entities = []
+
+    def stage_entities():
+        entities.extend(importToNeo4j.add_nodes(ext, record) for record in records)
+        return len(entities), {"registries": ext.registry_stats()}
+
+    def stage_relations():
+        for record, entity in zip(records, entities):
+            importToNeo4j.add_relations(ext, record, *entity)
+        return len(records), dict()
+
+    time_stage(results, "entity_build", stage_entities)
+    time_stage(results, "relation_build", stage_relations)
+
+    # Everything that would be written, to render it.
+    recorder = RecordingWriter()
+    reset_next_id()
+    with redirect_stdout(devnull):
+        importToNeo4j.process_xml(SessionExtension(None, writer=recorder), file)
+
+    def stage_render_literal():
+        for class_name, props in recorder.nodes:
+            Stmt.create_node("n", class_name, props)
+        for n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique in recorder.edges:
+            Stmt.create_edge_by_ids("n1", n1_class, n1_id, "n2", n2_class, n2_id, edge_class, edge_props,
+                                    is_unique=is_unique)
+        return len(recorder.nodes) + len(recorder.edges), dict()
+
+    def stage_render_compiled():
+        compiled = dict()
+        for class_name, props in recorder.nodes:
+            key = (class_name, tuple(props.keys()))
+            stmt = compiled.get(key)
+            if stmt is None:
+                stmt = compiled[key] = Stmt.compile_node(class_name, key[1])
+            stmt.render(("n",), props.values())
+        for n1_class, n1_id, n2_class, n2_id, edge_class, edge_props, is_unique in recorder.edges:
+            key = (n1_class, n2_class, edge_class, tuple(edge_props.keys()), is_unique)
+            stmt = compiled.get(key)
+            if stmt is None:
+                stmt = compiled[key] = Stmt.compile_edge_by_ids("n1", n1_class, "n2", n2_class, edge_class, key[3],
+                                                                is_unique=is_unique)
+            stmt.render((n1_id, n2_id), edge_props.values())
+        return len(recorder.nodes) + len(recorder.edges), dict()
+
+    time_stage(results, "render_literal", stage_render_literal)
+    time_stage(results, "render_compiled", stage_render_compiled)
+
+    # The complete import of the file (streaming parse included), into a sink that only counts.
+    def stage_write(batch_size: int, sink: RecordingSink = None, pipelined: bool = False):
+        sink = sink if sink is not None else RecordingSink(keep=False)
+        pipeline = PipelinedSink(sink, BENCH_QUEUE_SIZE) if pipelined else None
+        with redirect_stdout(devnull):
+            importToNeo4j.process_xml(SessionExtension(pipeline if pipelined else sink, batch_size), file)
+        extra: Dict[str, Any] = dict()
+        if pipelined:
+            pipeline.stop()
+            extra.update(write_seconds=pipeline.write_seconds, backpressure_seconds=pipeline.wait_seconds)
+        extra.update(sink.get_counts())
+        return len(nodes), extra
+
+    time_stage(results, "write_literal", lambda: stage_write(0))
+    time_stage(results, "write_batched", lambda: stage_write(BENCH_BATCH_SIZE))
+    # The same with database latency, executing every statement before going on or from a writer thread.
+    time_stage(results, "write_batched_latency", lambda: stage_write(BENCH_BATCH_SIZE, LatencySink(keep=False)))
+    time_stage(results, "write_pipelined_latency",
+               lambda: stage_write(BENCH_BATCH_SIZE, LatencySink(keep=False), True))
+    return results
+
+
+def run_relation_benchmark(file: str) -> Dict[str, Any]:
+    results: Dict[str, Any] = dict()
+    reset_next_id()
+    recorder = RecordingWriter()
+    ext = SessionExtension(None, writer=recorder)
+    nodes = list(ActivityReader.iter_activities(file, False))
+    records = [ActivityExtractor().extract(node) for node in nodes]
+    entities = [importToNeo4j.add_nodes(ext, record) for record in records]
+    edge_count = len(recorder.edges)
+
+    def stage_relations():
+        for record, (activity, budget, organizations, policies, location, psm) in zip(records, entities):
+            importToNeo4j.add_relations(ext, record, activity, budget, organizations, policies, location, psm)
+        return len(recorder.edges) - edge_count, {"activities": len(nodes)}
+
+    time_stage(results, "relation_build_large", stage_relations)
+    time_stage_extract(results, "_large", nodes)
+    return results
+
+
+def generate_file(path: str, config: Dict[str, Any]) -> None:
+    if not os.path.exists(path):
+        print("Generating '{}'...".format(path))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        generate_iati(path, **config)
+
+
+def main():
+    output = sys.argv[1] if len(sys.argv) > 1 else RESULT_FILE
+    generate_file(BENCH_FILE, BENCH_CONFIG)
+    generate_file(LARGE_FILE, LARGE_CONFIG)
+    with open(os.devnull, "w") as devnull:
+        stages = run_benchmark(BENCH_FILE, devnull)
+    stages.update(run_relation_benchmark(LARGE_FILE))
+    report = {
+        "time": strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "file": BENCH_FILE,
+        "file_bytes": os.path.getsize(BENCH_FILE),
+        "config": BENCH_CONFIG,
+        "large_file": LARGE_FILE,
+        "large_config": LARGE_CONFIG,
+        "stages": stages
+    }
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(report, f, indent=2)
+    for name, stage in stages.items():
+        print("{:<20} {:8.3f} s {:10.0f} items/s".format(name, stage["seconds"], stage["items_per_second"]))
+    print("Results written to '{}'".format(output))
+
+
+if __name__ == '__main__':
+    main()
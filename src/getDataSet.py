@@ -1,7 +1,14 @@
 import xml.etree.ElementTree as ET
 
-# Can also add the other files. I can't sync them yet
-tree = ET.ElementTree(file='../data/IATIACTIVITIES19972007.xml')
+try:
+    from CompressedInput import open_input
+except ImportError:
+    from .CompressedInput import open_input
+
+# Can also add the other files. I can't sync them yet. The file may also be compressed (.gz, .bz2, .xz) or in a zip
+# archive ("archive.zip!member.xml").
+with open_input('../data/IATIACTIVITIES19972007.xml') as f:
+    tree = ET.ElementTree(file=f)
 
 # Important, a lot of the elements have a child named narrative/value containing the name/value under text
 
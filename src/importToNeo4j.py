@@ -1,6 +1,9 @@
 import csv
+import gzip
+import sys
 from time import localtime, strftime
-from typing import List
+from multiprocessing import Pool, Queue
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Tuple, Union
 from xml.etree import ElementTree as ET
 
 import neo4j.exceptions as neo_ex
@@ -10,16 +13,42 @@ from neo4j.v1 import GraphDatabase, basic_auth
 try:
     # The main module must import files from the same directory in this way, but PyCharm just can't recognize it.
     # http://stackoverflow.com/questions/41816973/modulenotfounderror-what-does-it-mean-main-is-not-a-package
-    from CypherStatementBuilder import CypherStatementBuilder as Stmt
     from Entities import *
     from SessionExtension import SessionExtension
     from EdgeAttr import EdgeAttr
+    from ActivityReader import ActivityReader
+    from CompressedInput import open_input, get_input_size
+    from ActivityExtractor import ActivityExtractor, ActivityRecord
+    from AdminCsvWriter import AdminCsvWriter
+    from ColumnarWriter import ColumnarWriter
+    from BatchWriter import RecordingWriter
+    from ImportCheckpoint import ImportCheckpoint, LOAD_CYPHER as CHECKPOINT_LOAD_CYPHER, \
+        DELETE_CYPHER as CHECKPOINT_DELETE_CYPHER
+    from DeltaIndex import DeltaIndex
+    from WriteSink import WriteSink, CypherFileSink, RecordingSink
+    from BoltSink import BoltSink
+    from PipelinedSink import PipelinedSink
+    from SessionPool import SessionPool
+    from ImportMetrics import ImportMetrics
 except ImportError:
     # So do a trick, use the standard Python 3 import syntax to feed PyCharm's intellisense.
-    from .CypherStatementBuilder import CypherStatementBuilder as Stmt
     from .Entities import *
     from .SessionExtension import SessionExtension
     from .EdgeAttr import EdgeAttr
+    from .ActivityReader import ActivityReader
+    from .CompressedInput import open_input, get_input_size
+    from .ActivityExtractor import ActivityExtractor, ActivityRecord
+    from .AdminCsvWriter import AdminCsvWriter
+    from .ColumnarWriter import ColumnarWriter
+    from .BatchWriter import RecordingWriter
+    from .ImportCheckpoint import ImportCheckpoint, LOAD_CYPHER as CHECKPOINT_LOAD_CYPHER, \
+        DELETE_CYPHER as CHECKPOINT_DELETE_CYPHER
+    from .DeltaIndex import DeltaIndex
+    from .WriteSink import WriteSink, CypherFileSink, RecordingSink
+    from .BoltSink import BoltSink
+    from .PipelinedSink import PipelinedSink
+    from .SessionPool import SessionPool
+    from .ImportMetrics import ImportMetrics
 
 SERVER_HOST = "localhost"
 SERVER_PORT = 7687
@@ -27,6 +56,7 @@ AUTH_USER = "neo4j"
 AUTH_PASSWORD = "neo"
 
 CLASS_LIST = ["Activity", "Budget", "Organization", "Policy", "Location"]
+# Also .xml.gz / .xml.bz2 / .xml.xz files and zip archive members ("archive.zip!member.xml"), read without unpacking.
 XML_FILES = [
     "../data/IATIACTIVITIES19972007.xml",
     "../data/IATIACTIVITIES20082009.xml",
@@ -43,257 +73,606 @@ def timestr() -> str:
 
 TASK_IMPORT_ELEMENTS = True
 TASK_GENERATE_CSV = True
+# Rows per parameterized UNWIND statement; 0 writes one literal statement per node and edge.
+BATCH_SIZE = 1000
+# Handle one 'iati-activity' at a time instead of loading each XML file as a whole.
+STREAMING_PARSE = True
+
+OUTPUT_BOLT = "bolt"
+OUTPUT_ADMIN_CSV = "admin_csv"
+OUTPUT_CYPHER_FILE = "cypher_file"
+OUTPUT_RECORDING = "recording"
+OUTPUT_COLUMNAR = "columnar"
+# OUTPUT_BOLT writes into the running database. OUTPUT_ADMIN_CSV writes header + data CSV files to ADMIN_IMPORT_DIR
+# instead, to be loaded into an empty database with 'neo4j-admin import' (much faster for full rebuilds).
+# OUTPUT_CYPHER_FILE writes the statements to the script CYPHER_FILE, to be run later with cypher-shell.
+# OUTPUT_RECORDING only counts the statements, to measure parsing and transformation without a database.
+# OUTPUT_COLUMNAR writes the budgets, transactions and disbursements as NumPy columns to COLUMNAR_DIR, for analyses
+# without the database (see ColumnarWriter.load_table).
+OUTPUT_MODE = OUTPUT_BOLT
+ADMIN_IMPORT_DIR = "../import"
+CYPHER_FILE = "../import/import.cypher"
+COLUMNAR_DIR = "../columnar"
+# Write one .npz file per table instead of one .npy file per column (which can be memory-mapped).
+COLUMNAR_NPZ = False
+
+# Write nodes.csv.gz / edges.csv.gz instead of plain CSV files.
+CSV_GZIP = False
+# Print a progress line every this many exported rows; 0 only prints the totals.
+CSV_PROGRESS_EVERY = 100000
+
+# Activities per transaction; 0 commits once per XML file.
+COMMIT_EVERY = 1000
+# Progress of the import is recorded here after every commit. If the file exists when the import starts, the import
+# resumes after the last committed activity instead of clearing the database. Set to None to disable. Every commit
+# also writes the progress into the database (ImportCheckpoint nodes), which wins over the file when resuming.
+CHECKPOINT_FILE = "import_checkpoint.json"
+
+# Only import new and changed activities, and delete the withdrawn ones, instead of rebuilding the whole graph.
+# Activities are compared by the content hash stored with them. Runs sequentially, without checkpoints.
+INCREMENTAL = False
+# Store the content hash with the activities of other imports too, so the first INCREMENTAL import after them only
+# writes what has changed. Hashing takes most of the time of reading an activity, so it is off by default.
+STORE_CONTENT_HASH = False
+
+# Number of worker processes parsing the XML files in parallel; 0 parses them one after another in this process.
+PARALLEL_WORKERS = 0
+# Size of the obj_id range reserved for each XML file in parallel mode.
+ID_BLOCK_SIZE = 10 ** 8
+# Recordings of COMMIT_EVERY activities a worker may have waiting to be written before it stops parsing, in parallel
+# mode. Bounds the memory used for files that are parsed before their turn to be written comes.
+PARALLEL_CHUNKS_AHEAD = 4
+# Node class -> property identifying a node shared between activities (and files).
+SHARED_NODE_KEYS = {"Organization": "ref", "Policy": "code", "Location": "code"}
+
+# Let several importer processes write into the same database at the same time, each one loading its own files, e.g.
+# 'python importToNeo4j.py 0 1' and 'python importToNeo4j.py 2 3' (indices into XML_FILES). The database is not
+# cleared; uniqueness constraints on SHARED_NODE_KEYS are created instead, the shared nodes are MERGEd on them, and
+# every file gets its own obj_id block (ID_BLOCK_SIZE). Needs OUTPUT_BOLT and a positive BATCH_SIZE, without
+# checkpoints or incremental imports.
+CONCURRENT_UPSERT = False
+# How often a transaction failing with a transient error (deadlock, lock timeout) is run again; 0 disables. Only used
+# with CONCURRENT_UPSERT or WRITER_SESSIONS > 1, the statements of the open transaction are kept in memory for it.
+TRANSIENT_RETRIES = 5
+# Seconds before the first retry of a transaction, doubling with every further retry.
+RETRY_DELAY = 0.5
+
+# Statements queued for a writer thread, which executes them while the next ones are parsed and rendered; 0 executes
+# every statement before going on. Only used with a sink (OUTPUT_BOLT, OUTPUT_CYPHER_FILE, OUTPUT_RECORDING).
+PIPELINE_QUEUE_SIZE = 0
+# Number of Bolt sessions writing in parallel, each from its own writer thread with a queue of PIPELINE_QUEUE_SIZE
+# (at least POOL_QUEUE_SIZE) statements. Relation batches are split over the sessions by their shared end node (else
+# their start node, e.g. the activity), so the sessions rarely wait for each other's locks; deadlocks are retried
+# (TRANSIENT_RETRIES). Commits are not atomic over the sessions, so checkpoints are not used.
+WRITER_SESSIONS = 1
+POOL_QUEUE_SIZE = 16
+
+# Timers and counters per stage, relation type and file are written here at the end of the run. None disables.
+METRICS_FILE = "import_metrics.json"
+# Record the peak memory per file (tracemalloc). Slows the import down, mostly the parsing.
+METRICS_TRACE_MEMORY = False
+# Print the rate and the estimated remaining time of the current file every this many activities; 0 disables.
+PROGRESS_EVERY = 1000
+
+
+def get_driver() -> neo.Driver:
+    server_url = "bolt://{}:{}".format(SERVER_HOST, SERVER_PORT)
+    return GraphDatabase.driver(server_url, auth=basic_auth(AUTH_USER, AUTH_PASSWORD))
+
+
+def get_sink(driver: neo.Driver = None) -> WriteSink:
+    if OUTPUT_MODE == OUTPUT_BOLT:
+        driver = driver if driver is not None else get_driver()
+        # Only concurrent writers run into transient errors like deadlocks. Retrying means keeping the statements of
+        # the open transaction, so the other imports do not.
+        retries = TRANSIENT_RETRIES if CONCURRENT_UPSERT or WRITER_SESSIONS > 1 else 0
+        return BoltSink(driver.session(), retries, RETRY_DELAY)
+    elif OUTPUT_MODE == OUTPUT_CYPHER_FILE:
+        return CypherFileSink(CYPHER_FILE)
+    elif OUTPUT_MODE == OUTPUT_RECORDING:
+        return RecordingSink(keep=False)
+    raise ValueError("Unknown OUTPUT_MODE '{}'".format(OUTPUT_MODE))
+
+
+def reset_database(ext: SessionExtension) -> None:
+    print("Clearing indices...")
+    # This operation could fail at bootstrap
+    for class_name in CLASS_LIST:
+        try:
+            ext.run_session("DROP INDEX ON :{}(obj_id);".format(class_name))
+        except neo_ex.DatabaseError as ex:
+            print(ex.message)
+
+    print("Clearing nodes and relations...")
+    ext.run_session("MATCH (n) DETACH DELETE n;")
+
+    print("Creating indices...")
+    # https://stackoverflow.com/questions/24875665/how-to-bulk-insert-relationships
+    ext.begin_transaction()
+    for class_name in CLASS_LIST:
+        ext.run("CREATE INDEX ON :{}(obj_id);".format(class_name))
+    # Used by incremental imports to find the old version of an activity.
+    ext.run("CREATE INDEX ON :Activity(identifier);")
+    ext.commit()
+
+
+def create_constraints(ext: SessionExtension) -> None:
+    # Unlike reset_database, keeps the data: other processes may be importing already. Creating an existing index or
+    # constraint does nothing.
+    print("Creating constraints and indices...")
+    for class_name, key_name in SHARED_NODE_KEYS.items():
+        ext.run_session("CREATE CONSTRAINT ON (n:{}) ASSERT n.{} IS UNIQUE;".format(class_name, key_name))
+    for class_name in CLASS_LIST:
+        ext.run_session("CREATE INDEX ON :{}(obj_id);".format(class_name))
+    ext.run_session("CREATE INDEX ON :Activity(identifier);")
+
+
+def get_files(args: List[str]) -> List[str]:
+    # The files selected by their index in XML_FILES, or all of them.
+    if len(args) == 0:
+        return XML_FILES
+    # Other imports treat the activities of the files left out as withdrawn (INCREMENTAL), or clear the database.
+    if not CONCURRENT_UPSERT:
+        raise ValueError("Selecting XML files on the command line needs CONCURRENT_UPSERT")
+    return [XML_FILES[int(arg)] for arg in args]
+
+
+def check_id_block(file: str, first_id: int) -> None:
+    if peek_next_id() - first_id >= ID_BLOCK_SIZE:
+        raise OverflowError("'{}' needs more than {} obj_ids, increase ID_BLOCK_SIZE".format(file, ID_BLOCK_SIZE))
+
+
+def add_nodes(ext: SessionExtension, record: ActivityRecord) \
+        -> Tuple[Activity, Budget, List[Organization], List[Policy], Location, Dict[int, int]]:
+    # Activity
+    activity = Activity(record.identifier, record.description, record.status, record.title, record.dates,
+                        record.content_hash)
+    ext.add_activity(activity)
+
+    # Budget
+    if record.budget is None:
+        raise ValueError("Activity '{}' has no budget".format(record.identifier))
+    budget = Budget(*record.budget, activity)
+    ext.add_budget(budget)
+
+    # Organizations
+    organizations = []
+    # First the reporting organization (always Ministry of Foreign Affairs)
+    organization = ext.make_organization(*record.reporting_org)
+    organizations.append(organization)
+    ext.add_organization(organization)
+    # Then the participating organizations
+    for name, ref, ty in record.participating_orgs:
+        organization = ext.make_organization(name, ref, ty)
+        ext.add_organization(organization)
+        organizations.append(organization)
+
+    # policy code -> significance
+    policy_significance_map: Dict[int, int] = dict()
+    # Policy markers
+    policies = []
+    for code, name, significance in record.policy_markers:
+        policy = ext.make_policy(code, name)
+        policy_significance_map[policy.code] = significance
+        ext.add_policy(policy)
+        policies.append(policy)
+
+    # Locations
+    if record.get_location() is None:
+        raise ValueError("Activity '{}' has no recipient country or region".format(record.identifier))
+    location = ext.make_location(*record.get_location())
+    ext.add_location(location)
+
+    return activity, budget, organizations, policies, location, policy_significance_map
+
+
+def add_relations(ext: SessionExtension, record: ActivityRecord, activity: Activity, budget: Budget,
+                  organizations: List[Organization], policies: List[Policy], location: Location,
+                  policy_significance_map: Dict[int, int]):
+    # Initialize transaction list and disbursement list.
+    transactions = EdgeAttr.make_transactions(record.transactions, organizations)
+    disbursements = EdgeAttr.make_disbursements(record.disbursements, activity)
+    ext.add_flows(activity, budget, transactions, disbursements)
+
+    def get_pol_sig(code: int) -> int:
+        return policy_significance_map.get(code, 0)
+
+    # (Activity) -[Commits]-> (Budget)
+    ext.add_edge("Activity", activity.obj_id, "Budget", budget.obj_id,
+                 "Commits", EdgeAttr.commits(budget))
+
+    # (Activity) -[Executed_In]-> (Location)
+    ext.add_edge("Activity", activity.obj_id, "Location", location.obj_id,
+                 "Executed_In", EdgeAttr.executed_in(activity))
+
+    # 1. Ignore the first organization (reporting-org, always Ministry of Foreign Affairs).
+    # 2. Ignore the Ministry's appearance in all participating organizations.
+    partners = [org for i, org in enumerate(organizations) if i > 0 and org.ref != "XM-DAC-7"]
+    # Ignore the policies whose significance level is 0 ("not targeted").
+    targeted_policies = [pol for pol in policies if get_pol_sig(pol.code) > 0]
+
+    # (Organization) -[Implements]-> (Policy)
+    for org in partners:
+        for pol in targeted_policies:
+            # Note that the relation between a specific pair of organization and policy is unique.
+            ext.add_edge("Organization", org.obj_id, "Policy", pol.obj_id,
+                         "Implements", EdgeAttr.implements(), is_unique=True)
+
+    # (Budget) -[Transacts]-> (Organization)
+    if len(partners) > 0:
+        # Receiver obj_id -> its transactions, so every partner only visits its own transactions.
+        transactions_by_receiver: Dict[int, List[Transaction]] = dict()
+        for transaction in transactions:
+            # Type 2 = commitment, ignore it. Just keep the real transactions (type = 3).
+            if transaction.type == 2:
+                continue
+            # Here we use the "receiver-org" of transaction node instead of "participating-org" of
+            # activity node.
+            if transaction.receiver_org is None:
+                if TRANSACTION_DEBUG:
+                    print(
+                        "[WARN] Cannot create relation 'transfers to' between budget and organization, "
+                        "having a transaction as attribute. Receiver name={}".format(
+                            transaction.receiver_name))
+                continue
+            transactions_by_receiver.setdefault(transaction.receiver_org.obj_id, []).append(transaction)
+        for org in partners:
+            for transaction in transactions_by_receiver.get(org.obj_id, ()):
+                ext.add_edge("Budget", budget.obj_id, "Organization", org.obj_id,
+                             "Transacts", EdgeAttr.transacts(transaction))
+
+    # (Budget) -[Plans_Disbursement]-> (Organization)
+    # Every partner gets every disbursement, so only build the attributes once.
+    disbursement_attrs = [EdgeAttr.plans_disbursement(disbursement) for disbursement in disbursements]
+    for org in partners:
+        for attrs in disbursement_attrs:
+            ext.add_edge("Budget", budget.obj_id, "Organization", org.obj_id,
+                         "Plans_Disbursement", attrs)
+
+    # (Activity) -[Supports]-> (Policy)
+    for pol in targeted_policies:
+        ext.add_edge("Activity", activity.obj_id, "Policy", pol.obj_id,
+                     "Supports", EdgeAttr.supports(activity, pol, policy_significance_map))
+
+    # (Organization) -[Participates_In]-> (Activity)
+    for org in partners:
+        ext.add_edge("Organization", org.obj_id, "Activity", activity.obj_id,
+                     "Participates_In", EdgeAttr.participates_in(activity))
+
+    # (Budget) -[Funds] -> (Policy)
+    for pol in targeted_policies:
+        ext.add_edge("Budget", budget.obj_id, "Policy", pol.obj_id,
+                     "Funds", EdgeAttr.funds(budget))
+
+
+def process_xml(ext: SessionExtension, file: str, checkpoint: ImportCheckpoint = None,
+                delta: DeltaIndex = None) -> None:
+    skip, last_identifier, done = checkpoint.get_progress(file) if checkpoint is not None else (0, None, False)
+    if done:
+        print("Skipping '{}', it has been imported already.".format(file))
+        return
+    # Stages are timed anyway, it is cheap at this level; the metrics are only kept if the extension has them.
+    metrics = ext.metrics if ext.metrics is not None else ImportMetrics()
+    extractor = ActivityExtractor(delta is not None or STORE_CONTENT_HASH)
+
+    def commit(activities: int, identifier: str, file_done: bool) -> None:
+        if checkpoint is not None:
+            # Committed together with the activities: a crash before the checkpoint file is saved must not make a
+            # resume import them again.
+            ext.run(*checkpoint.get_save_statement(file, activities, identifier, file_done, peek_next_id() - 1,
+                                                   ext.get_shared_state()))
+        with metrics.stage("commit"):
+            ext.commit()
+        metrics.count("commits")
+        if checkpoint is not None:
+            with metrics.stage("checkpoint"):
+                # The activities must be in the database before the checkpoint says so.
+                ext.sync()
+                checkpoint.save(file, activities, identifier, file_done, peek_next_id() - 1, ext.get_shared_state())
+
+    ext.begin_transaction()
+
+    if skip > 0:
+        print("Resuming '{}' after activity {} ({})... ({})".format(file, skip, last_identifier, timestr()))
+    else:
+        print("Adding activities for '{}'... ({})".format(file, timestr()))
+    count = 0
+    # Compressed files are decompressed in a thread of their own, while the activities read before are processed.
+    with open_input(file) as f:
+        metrics.start_file(file, get_input_size(file))
+        for activity_node in metrics.timed_iter("parse", ActivityReader.iter_activities(f, STREAMING_PARSE)):
+            activity_node: ET.Element = activity_node
+            count += 1
+            if count <= skip:
+                if count == skip and activity_node.find("iati-identifier").text != last_identifier:
+                    raise ValueError("'{}' has changed since the checkpoint was written, activity {} is not '{}'"
+                                     .format(file, skip, last_identifier))
+                metrics.count("activities_resumed")
+                continue
+            # Includes the content hash, if there is a delta to compare it with or it is stored.
+            with metrics.stage("extract"):
+                record = extractor.extract(activity_node)
+            if delta is not None and not delta.should_import(record.identifier, record.content_hash):
+                metrics.count("activities_unchanged")
+                continue
+            with metrics.stage("entity_build"):
+                t_activity, t_budget, t_organizations, t_policies, t_location, t_psm = add_nodes(ext, record)
+            with metrics.stage("relation_build"):
+                add_relations(ext, record, t_activity, t_budget, t_organizations, t_policies, t_location, t_psm)
+            metrics.count("activities")
+            last_identifier = t_activity.identifier
+
+            if COMMIT_EVERY > 0 and count % COMMIT_EVERY == 0:
+                commit(count, last_identifier, False)
+                ext.begin_transaction()
+            if PROGRESS_EVERY > 0 and count % PROGRESS_EVERY == 0:
+                print("{} ({})".format(metrics.progress(count, f.tell()), timestr()))
+
+        print("Committing...")
+        commit(count, last_identifier, True)
+        metrics.end_file(count)
+
+
+# Set in the worker processes by init_worker: one queue per XML file, receiving its recordings.
+worker_queues: List[Any] = None
+
+
+def init_worker(queues: List[Any]) -> None:
+    global worker_queues
+    worker_queues = queues
+
+
+def parse_xml(job: Tuple[int, int, str]) -> None:
+    # Runs in a worker process: build the entities and relations of one file, but keep them instead of writing them.
+    # Every file gets its own obj_id block, so the ids do not depend on which worker parses which file.
+    # The queue of the file gets one recording per commit of process_xml (COMMIT_EVERY activities), then the metrics,
+    # or the exception ending the parsing.
+    queue_index, file_index, file = job
+    chunks = worker_queues[queue_index]
+    try:
+        first_id = file_index * ID_BLOCK_SIZE
+        reset_next_id(first_id)
+        metrics = ImportMetrics(METRICS_TRACE_MEMORY)
+        process_xml(SessionExtension(None, writer=RecordingWriter(chunks.put), metrics=metrics), file)
+        check_id_block(file, first_id)
+        chunks.put(metrics)
+    except BaseException as ex:
+        chunks.put(ex)
+
+
+def process_xml_parallel(ext: SessionExtension, files: List[str], workers: int) -> None:
+    # Shared organizations, policies and locations are created again by every worker. Keep the first one (in file
+    # order) and point the relations of the others at it.
+    shared_ids: Dict[Tuple[str, Any], int] = dict()
+    # obj_ids are unique across files, so the duplicates of all files can share one map.
+    id_map: Dict[int, int] = dict()
+    metrics = ext.metrics if ext.metrics is not None else ImportMetrics()
+    # The recordings are written while the workers parse on. A worker parsing a file whose turn has not come yet
+    # waits when PARALLEL_CHUNKS_AHEAD of its recordings are queued.
+    queues = [Queue(PARALLEL_CHUNKS_AHEAD) for _ in files]
+    with Pool(workers, init_worker, (queues,)) as pool:
+        # The obj_id blocks follow the position in XML_FILES, so they do not depend on the selected files.
+        # The files are handed out in order, one at a time, so the one written next is always being parsed.
+        result = pool.map_async(parse_xml, [(i, XML_FILES.index(file), file) for i, file in enumerate(files)],
+                                chunksize=1)
+        for file, chunks in zip(files, queues):
+            print("Writing parsed activities of '{}'... ({})".format(file, timestr()))
+            while True:
+                chunk = chunks.get()
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                if isinstance(chunk, ImportMetrics):
+                    # The stage times of the workers overlap with each other and with the replay. The nodes,
+                    # relations and commits are counted by the replay and the commits here.
+                    metrics.merge(chunk, written=False)
+                    break
+                ext.begin_transaction()
+                with metrics.stage("replay"):
+                    chunk.replay(ext, shared_ids, SHARED_NODE_KEYS, id_map)
+                with metrics.stage("commit"):
+                    ext.commit()
+                metrics.count("commits")
+        result.get()
+
+
+def open_csv(path: str) -> TextIO:
+    if CSV_GZIP:
+        return gzip.open(path + ".gz", "wt", encoding="utf8", newline="")
+    return open(path, "w", encoding="utf8", newline="")
+
+
+def write_csv_rows(path: str, rows: Iterable[list], what: str) -> int:
+    # Rows are written as they come in, nothing is kept in memory.
+    count = 0
+    with open_csv(path) as csvfile:
+        csvwriter = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
+        for row in rows:
+            csvwriter.writerow(row)
+            count += 1
+            if CSV_PROGRESS_EVERY > 0 and count % CSV_PROGRESS_EVERY == 0:
+                print("{} {} saved ({})".format(count, what, timestr()))
+    print("{} {} saved in total ({})".format(count, what, timestr()))
+    return count
+
+
+def get_node_row(record: Any) -> list:
+    node = ['Node Label', record[1][0]]
+    for item in record[0]:
+        if item['key'] == 'obj_id':
+            node.insert(0, item['value'])
+        else:
+            node.append(item['key'])
+            node.append(item['value'])
+    return node
+
+
+def get_edge_records(sess: neo.Session) -> Iterator[Any]:
+    # One query per relation type, returning only the obj_ids of the end nodes instead of the complete nodes (with
+    # e.g. the long activity descriptions) of which only the obj_id would be used.
+    edge_types = [record[0] for record in sess.run("CALL db.relationshipTypes()")]
+    for edge_type in edge_types:
+        print("Find edges of type {} ({})".format(edge_type, timestr()))
+        yield from sess.run("MATCH (n1) -[t:`{}`]-> (n2) "
+                            "RETURN EXTRACT(key IN keys(t) | {{value: t[key], key:key}}), n1.obj_id, n2.obj_id, type(t)"
+                            .format(edge_type))
+
+
+def get_edge_rows(records: Iterable[Any]) -> Iterator[list]:
+    for edge_count, record in enumerate(records):
+        edge = [edge_count, record[1], record[2], 'Edge Label', record[3]]
+        for item in record[0]:
+            if item['key'] == 'obj_id':
+                edge.insert(0, item['value'])
+            else:
+                edge.append(item['key'])
+                edge.append(item['value'])
+        yield edge
+
+
+def generate_csv(sess: neo.Session) -> None:
+    print("Find and save all nodes ({})".format(timestr()))
+    result = sess.run("MATCH (n) RETURN EXTRACT(key IN keys(n) | {value: n[key], key:key}), labels(n)")
+    write_csv_rows('nodes.csv', (get_node_row(record) for record in result), "nodes")
+
+    # Save edges
+    print("Find and save all edges ({})".format(timestr()))
+    write_csv_rows('edges.csv', get_edge_rows(get_edge_records(sess)), "edges")
 
 
 def main():
-    server_url = "bolt://{}:{}".format(SERVER_HOST, SERVER_PORT)
-    driver: neo.Driver = GraphDatabase.driver(server_url, auth=basic_auth(AUTH_USER, AUTH_PASSWORD))
-    session: neo.Session = driver.session()
-
-    ext = SessionExtension(session)
+    files = get_files(sys.argv[1:])
+    admin_csv = OUTPUT_MODE == OUTPUT_ADMIN_CSV
+    columnar = OUTPUT_MODE == OUTPUT_COLUMNAR
+    sink: WriteSink = None
+    pipeline: Union[PipelinedSink, SessionPool] = None
+    metrics = ImportMetrics(METRICS_TRACE_MEMORY)
+    if admin_csv:
+        csv_writer = AdminCsvWriter(ADMIN_IMPORT_DIR)
+        ext = SessionExtension(None, writer=csv_writer, metrics=metrics)
+    elif columnar:
+        columnar_writer = ColumnarWriter(COLUMNAR_DIR, COLUMNAR_NPZ)
+        ext = SessionExtension(None, writer=columnar_writer, metrics=metrics)
+    else:
+        if WRITER_SESSIONS > 1:
+            if OUTPUT_MODE != OUTPUT_BOLT or BATCH_SIZE <= 0:
+                raise ValueError("WRITER_SESSIONS needs OUTPUT_BOLT and a positive BATCH_SIZE")
+            driver = get_driver()
+            sinks = [get_sink(driver) for _ in range(WRITER_SESSIONS)]
+            sink = sinks[0]
+            pipeline = SessionPool(sinks, max(PIPELINE_QUEUE_SIZE, POOL_QUEUE_SIZE))
+        else:
+            sink = get_sink()
+            if PIPELINE_QUEUE_SIZE > 0:
+                pipeline = PipelinedSink(sink, PIPELINE_QUEUE_SIZE)
+        ext = SessionExtension(pipeline if pipeline is not None else sink, BATCH_SIZE, metrics=metrics,
+                               upsert_keys=SHARED_NODE_KEYS if CONCURRENT_UPSERT else None)
+    # Only the database can be read back, for checkpoints, incremental imports and the CSV export.
+    bolt = isinstance(sink, BoltSink)
+    if CONCURRENT_UPSERT and (not bolt or INCREMENTAL):
+        raise ValueError("CONCURRENT_UPSERT imports write into the database, and cannot be incremental")
 
     print("--- Task started ---")
     print(timestr())
 
     if TASK_IMPORT_ELEMENTS:
-        print("Clearing indices...")
-        # This operation could fail at bootstrap
-        for class_name in CLASS_LIST:
-            try:
-                ext.run_session("DROP INDEX ON :{}(obj_id);".format(class_name))
-            except neo_ex.DatabaseError as ex:
-                print(ex.message)
-
-        print("Clearing nodes and relations...")
-        ext.run_session("MATCH (n) DETACH DELETE n;")
-
-        print("Creating indices...")
-        # https://stackoverflow.com/questions/24875665/how-to-bulk-insert-relationships
-        trans = session.begin_transaction()
-        for class_name in CLASS_LIST:
-            trans.run("CREATE INDEX ON :{}(obj_id);".format(class_name))
-        trans.commit()
-        trans.close()
-
-        def process_xml(file: str) -> None:
-            tree = ET.ElementTree(file=file)
-
-            ext.begin_transaction()
-
-            print("Adding activities for '{}'... ({})".format(file, timestr()))
-            for activity_node in tree.iter("iati-activity"):
-                activity_node: ET.Element = activity_node
-
-                def add_nodes():
-                    # Activity
-                    activity = ext.get_activity(activity_node)
-                    ext.add_activity(activity)
-
-                    # Budget
-                    budget_node: ET.Element = activity_node.find("budget")
-                    budget = ext.get_budget(budget_node, activity)
-                    ext.add_budget(budget)
-
-                    # Organizations
-                    organizations = []
-                    # First the reporting organization (always Ministry of Foreign Affairs)
-                    reporting_org_node: ET.Element = activity_node.find("reporting-org")
-                    organization = ext.get_organization(reporting_org_node)
-                    organizations.append(organization)
-                    ext.add_organization(organization)
-                    # Then the participating organizations
-                    for participating_org_node in activity_node.iter("participating-org"):
-                        organization = ext.get_organization(participating_org_node)
-                        ext.add_organization(organization)
-                        organizations.append(organization)
-
-                    # policy code -> significance
-                    policy_significance_map: Dict[int, int] = dict()
-                    # Policy markers
-                    policies = []
-                    for policy_marker_node in activity_node.iter("policy-marker"):
-                        policy = ext.get_policy(policy_marker_node)
-                        policy_significance_map[policy.code] = int(policy_marker_node.get("significance"))
-                        ext.add_policy(policy)
-                        policies.append(policy)
-
-                    # Locations
-                    recipient_node = activity_node.find("recipient-country")
-                    if recipient_node is None:
-                        recipient_node = activity_node.find("recipient-region")
-                    location = ext.get_location(recipient_node)
-                    ext.add_location(location)
-
-                    return activity, budget, organizations, policies, location, policy_significance_map
-
-                t_activity, t_budget, t_organizations, t_policies, t_location, t_psm = add_nodes()
-
-                def add_relations(activity: Activity, budget: Budget, organizations: List[Organization],
-                                  policies: List[Policy], location: Location, policy_significance_map: Dict[int, int]):
-                    # Initialize transaction list and disbursement list.
-                    transactions = EdgeAttr.get_transactions(activity_node, organizations)
-                    disbursements = EdgeAttr.get_disbursements(activity_node, activity)
-
-                    def get_pol_sig(code: int) -> int:
-                        return policy_significance_map.get(code, 0)
-
-                    # (Activity) -[Commits]-> (Budget)
-                    stmt = Stmt.create_edge_by_ids("act", "Activity", activity.obj_id,
-                                                   "budget", "Budget", budget.obj_id,
-                                                   "Commits", EdgeAttr.commits(budget))
-                    ext.run(stmt)
-
-                    # (Activity) -[Executed_In]-> (Location)
-                    stmt = Stmt.create_edge_by_ids("act", "Activity", activity.obj_id,
-                                                   "loc", "Location", location.obj_id,
-                                                   "Executed_In", EdgeAttr.executed_in(activity))
-                    ext.run(stmt)
-
-                    # (Organization) -[Implements]-> (Policy)
-                    for i, org in enumerate(organizations):
-                        # 1. Ignore the first organization (reporting-org, always Ministry of Foreign Affairs).
-                        # 2. Ignore the Ministry's appearance in all participating organizations.
-                        if i == 0 or org.ref == "XM-DAC-7":
-                            continue
-                        for pol in policies:
-                            if get_pol_sig(pol.code) > 0:
-                                # Note that the relation between a specific pair of organization and policy is unique.
-                                stmt = Stmt.create_edge_by_ids("org", "Organization", org.obj_id,
-                                                               "pol", "Policy", pol.obj_id,
-                                                               "Implements", EdgeAttr.implements(),
-                                                               is_unique=True)
-                                ext.run(stmt)
-
-                    # (Budget) -[Transacts]-> (Organization)
-                    for i, org in enumerate(organizations):
-                        if i == 0 or org.ref == "XM-DAC-7":
-                            continue
-                        for transaction in transactions:
-                            # Type 2 = commitment, ignore it. Just keep the real transactions (type = 3).
-                            if transaction.type == 2:
-                                continue
-                            # Here we use the "receiver-org" of transaction node instead of "participating-org" of
-                            # activity node.
-                            if transaction.receiver_org is None:
-                                if TRANSACTION_DEBUG:
-                                    print(
-                                        "[WARN] Cannot create relation 'transfers to' between budget and organization, "
-                                        "having a transaction as attribute. Receiver name={}".format(
-                                            transaction.receiver_name))
-                                continue
-                            if transaction.receiver_org.obj_id == org.obj_id:
-                                stmt = Stmt.create_edge_by_ids("bud", "Budget", budget.obj_id,
-                                                               "org", "Organization", org.obj_id,
-                                                               "Transacts",
-                                                               EdgeAttr.transacts(transaction))
-                                ext.run(stmt)
-
-                    # (Budget) -[Plans_Disbursement]-> (Organization)
-                    for i, org in enumerate(organizations):
-                        if i == 0 or org.ref == "XM-DAC-7":
-                            continue
-                        for disbursement in disbursements:
-                            stmt = Stmt.create_edge_by_ids("bud", "Budget", budget.obj_id,
-                                                           "org", "Organization", org.obj_id,
-                                                           "Plans_Disbursement",
-                                                           EdgeAttr.plans_disbursement(disbursement))
-                            ext.run(stmt)
-
-                    # (Activity) -[Supports]-> (Policy)
-                    for pol in policies:
-                        # Ignore the policies whose significance level is 0 ("not targeted").
-                        if get_pol_sig(pol.code) > 0:
-                            stmt = Stmt.create_edge_by_ids("act", "Activity", activity.obj_id,
-                                                           "pol", "Policy", pol.obj_id,
-                                                           "Supports",
-                                                           EdgeAttr.supports(activity, pol, policy_significance_map))
-                            ext.run(stmt)
-
-                    # (Organization) -[Participates_In]-> (Activity)
-                    for i, org in enumerate(organizations):
-                        # 1. Ignore the first organization (reporting-org, always Ministry of Foreign Affairs).
-                        # 2. Ignore the Ministry's appearance in all participating organizations.
-                        if i > 0 and org.ref != "XM-DAC-7":
-                            stmt = Stmt.create_edge_by_ids("org", "Organization", org.obj_id,
-                                                           "act", "Activity", activity.obj_id,
-                                                           "Participates_In", EdgeAttr.participates_in(activity))
-                            ext.run(stmt)
-
-                    # (Budget) -[Funds] -> (Policy)
-                    for pol in policies:
-                        if get_pol_sig(pol.code) > 0:
-                            stmt = Stmt.create_edge_by_ids("bud", "Budget", budget.obj_id,
-                                                           "pol", "Policy", pol.obj_id,
-                                                           "Funds", EdgeAttr.funds(budget))
-                            ext.run(stmt)
-
-                add_relations(t_activity, t_budget, t_organizations, t_policies, t_location, t_psm)
-
-            print("Committing...")
-            ext.commit()
-
-        for xml_file in XML_FILES:
-            process_xml(xml_file)
-
-    if TASK_GENERATE_CSV:
-        def generate_csv(sess: neo.Session):
-            print("Find all nodes ({})".format(timestr()))
-            nodes = []
-            result = sess.run("MATCH (n) RETURN EXTRACT(key IN keys(n) | {value: n[key], key:key}), labels(n)")
-            for record in result:
-                node = ['Node Label', record[1][0]]
-                pre_node = record[0]
-                for item in pre_node:
-                    if item['key'] == 'obj_id':
-                        node.insert(0, item['value'])
-                    else:
-                        node.append(item['key'])
-                        if isinstance(item['value'], str):
-                            node.append(item['value'])
-                        else:
-                            node.append(item['value'])
-                nodes.append(node)
-
-            print("Save nodes in csv file ({})".format(timestr()))
-            with open('nodes.csv', 'w', encoding='utf8') as csvfile:
-                csvwriter = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
-                for node in nodes:
-                    csvwriter.writerow(node)
-
-            # Save edges
-            print("Find all edges ({})".format(timestr()))
-            edges = []
-            edge_count = 0
-            result = sess.run(
-                "MATCH (n1) -[t]-> (n2) RETURN EXTRACT(key IN keys(t) | {value: t[key], key:key}), n1, n2, type(t)")
-            for record in result:
-                edge = [edge_count]
-                edge_count += 1
-                edge.append(record[1]["obj_id"])
-                edge.append(record[2]["obj_id"])
-                edge.append('Edge Label')
-                edge.append(record[3])
-                pre_edge = record[0]
-                for item in pre_edge:
-                    if item['key'] == 'obj_id':
-                        edge.insert(0, item['value'])
-                    else:
-                        edge.append(item['key'])
-                        if isinstance(item['value'], str):
-                            edge.append(item['value'])
-                        else:
-                            edge.append(item['value'])
-                edges.append(edge)
-
-            print("Save edges in csv file ({})".format(timestr()))
-            with open('edges.csv', 'w', encoding="utf8") as csvfile:
-                csvwriter = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
-                for edge in edges:
-                    csvwriter.writerow(edge)
-
-        generate_csv(session)
-
-    session.close()
+        # Checkpoints are kept for sequential imports into the database only.
+        checkpoint: ImportCheckpoint = None
+        if CHECKPOINT_FILE is not None and bolt and PARALLEL_WORKERS == 0 and not INCREMENTAL \
+                and not CONCURRENT_UPSERT and WRITER_SESSIONS == 1:
+            checkpoint = ImportCheckpoint(CHECKPOINT_FILE)
+
+        delta: DeltaIndex = None
+        if INCREMENTAL:
+            if not bolt or PARALLEL_WORKERS > 0:
+                raise ValueError("INCREMENTAL imports write into the database, one file after another")
+            print("Loading content hashes of the imported activities...")
+            delta = DeltaIndex()
+            delta.load(ext)
+            ext.load_shared_state()
+            reset_next_id(ext.get_max_obj_id())
+            ext.run_session("CREATE INDEX ON :Activity(identifier);")
+        elif checkpoint is not None and checkpoint.load():
+            print("Resuming from checkpoint '{}'...".format(CHECKPOINT_FILE))
+            checkpoint.load_database(ext.query(CHECKPOINT_LOAD_CYPHER))
+            ext.restore_shared_state(checkpoint.shared_state)
+            reset_next_id(checkpoint.last_id)
+        elif CONCURRENT_UPSERT:
+            with metrics.stage("reset"):
+                create_constraints(ext)
+        elif sink is not None:
+            with metrics.stage("reset"):
+                reset_database(ext)
+
+        if PARALLEL_WORKERS > 0:
+            process_xml_parallel(ext, files, PARALLEL_WORKERS)
+        else:
+            for xml_file in files:
+                if CONCURRENT_UPSERT:
+                    # The obj_ids of other processes must not be reused.
+                    first_id = XML_FILES.index(xml_file) * ID_BLOCK_SIZE
+                    reset_next_id(first_id)
+                    process_xml(ext, xml_file)
+                    check_id_block(xml_file, first_id)
+                else:
+                    process_xml(ext, xml_file, checkpoint, delta)
+            if checkpoint is not None:
+                # Everything is imported, the next run starts from scratch again.
+                ext.run_session(CHECKPOINT_DELETE_CYPHER)
+                checkpoint.remove()
+            if delta is not None:
+                print("Deleting changed and withdrawn activities... ({})".format(timestr()))
+                with metrics.stage("delete_stale"):
+                    deleted = delta.delete_stale(ext)
+                print("{} activities unchanged, {} imported, {} old versions deleted"
+                      .format(delta.unchanged, delta.imported, deleted))
+
+            for class_name, stats in ext.registry_stats().items():
+                print("{}: {known} known, {written} written, hit rate {hit_rate:.1%}".format(class_name, **stats))
+
+        if pipeline is not None:
+            with metrics.stage("pipeline_drain"):
+                pipeline.stop()
+            # The writer thread overlaps with the other stages; 'db_round_trip' is the time spent queueing.
+            metrics.add_time("pipeline_write", pipeline.write_seconds, pipeline.writes)
+            metrics.add_time("pipeline_backpressure", pipeline.wait_seconds)
+            if isinstance(pipeline, SessionPool):
+                for i, stats in enumerate(pipeline.get_stats()):
+                    print("Session {}: {statements} statements, {rows} rows in {write_seconds:.1f} s, "
+                          "{rows_per_second:.0f} rows/s, {retries} retries ({deadlocks} deadlocks)".format(i, **stats))
+
+        if admin_csv:
+            csv_writer.close()
+            print("Load the CSV files into an empty, stopped database with:")
+            print(csv_writer.get_import_command())
+            print("Then start the database and create the obj_id indices.")
+        elif columnar:
+            with metrics.stage("columnar_write"):
+                counts = columnar_writer.close()
+            print("Columns written to '{}': {}".format(COLUMNAR_DIR, ", ".join(
+                "{} {}".format(count, table) for table, count in counts.items())))
+        elif isinstance(sink, CypherFileSink):
+            print("{} statements written to '{}'".format(sink.statements, sink.path))
+        elif isinstance(sink, RecordingSink):
+            print("{statements} statements with {rows} batched rows in {commits} transactions".format(
+                **sink.get_counts()))
+
+    if TASK_GENERATE_CSV and bolt:
+        with metrics.stage("csv_export"):
+            generate_csv(sink.session)
+
+    if isinstance(pipeline, SessionPool):
+        metrics.count("transaction_retries", sum(s.retried for s in pipeline.sinks))
+    elif bolt:
+        metrics.count("transaction_retries", sink.retried)
+    if pipeline is not None:
+        pipeline.close()
+    elif sink is not None:
+        sink.close()
+
+    if METRICS_FILE is not None:
+        sessions = pipeline.get_stats() if isinstance(pipeline, SessionPool) else []
+        metrics.save(METRICS_FILE, registries=ext.registry_stats(), sessions=sessions)
+        print("Metrics written to '{}'".format(METRICS_FILE))
 
     print("--- Task completed ---")
     print(timestr())
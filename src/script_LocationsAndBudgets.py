@@ -1,12 +1,10 @@
-from typing import List, Dict, Tuple
-
 import neo4j.v1 as neo
 from neo4j.v1 import GraphDatabase, basic_auth
 
 try:
-    from CypherStatementBuilder import *
+    from LocationRegions import REGION_EDGE_TPL, get_region_rows
 except ImportError:
-    from .CypherStatementBuilder import *
+    from .LocationRegions import REGION_EDGE_TPL, get_region_rows
 
 """
 ╒════════════════════════════════════════════╤════════╕
@@ -140,65 +138,20 @@ SERVER_PORT = 7687
 AUTH_USER = "neo4j"
 AUTH_PASSWORD = "neo"
 
-country_region_map: Dict[int, List[str]] = {
-    189: [  # North Sahara
-        "DZ", "EG", "ER", "ET", "LY", "MA", "MR", "TN"
-    ], 289: [  # South Sahara
-        "AO", "BF", "BI", "BJ", "BW", "CD", "CF", "CG", "CI", "CM", "CV", "GH", "GN", "LR", "ML", "MW", "MZ",
-        "NA", "NE", "NG", "RW", "SD", "SL", "SN", "SO", "SS", "TD", "TZ", "UG", "ZA", "ZM", "ZW"
-    ], 298: [  # Africa
-    ], 389: [  # North/Central America
-        "CR", "CU", "DO", "GT", "HN", "HT", "KE", "MX", "NI", "PA", "SV", "VE"
-    ], 489: [  # South America
-        "AR", "BO", "BR", "CL", "CO", "EC", "PE", "PY", "SR", "UY"
-    ], 498: [  # America
-    ], 589: [  # Middle East
-        "IQ", "IR", "JO", "LB", "PS", "SY", "TR"
-    ], 619: [  # Central Asia
-        "KG", "KZ", "MN", "TJ", "YE"
-    ], 679: [  # South  Asia
-        "AF", "BD", "BT", "ID", "IN", "KH", "LA", "LK", "MM", "MY", "NP", "PH", "PK", "TH", "VN"
-    ], 789: [  # Far East Asia
-        "CN", "KP"
-    ], 798: [  # Asia
-    ], 89: [  # Europe
-        "AL", "AM", "AZ", "BA", "BY", "GE", "HR", "MD", "ME", "MK", "RS", "UA", "XK",
-    ], 998: [  # World Wide
-        "PG", "VU"  # Oceania
-    ]
-}
-
 if __name__ == '__main__':
     server_url = "bolt://{}:{}".format(SERVER_HOST, SERVER_PORT)
     driver: neo.Driver = GraphDatabase.driver(server_url, auth=basic_auth(AUTH_USER, AUTH_PASSWORD))
     session: neo.Session = driver.session()
 
     trans: neo.Transaction = session.begin_transaction()
-    query = "MATCH ()-[b:BELONGS_TO]-() DETACH DELETE b;"
+    query = "MATCH ()-[b:BELONGS_TO|IN_REGION]-() DETACH DELETE b;"
     trans.run(query)
     trans.commit()
 
-    belongs_to_tpl = "MATCH (c:Location), (r:Location) WHERE c.code={} AND r.code={} " \
-                     "CREATE (c)-[:BELONGS_TO]->(r);"
-
-    trans = session.begin_transaction()
-    for kv1 in country_region_map.items():
-        region_code: str = kv1[0]
-        country_list: List[str] = kv1[1]
-
-        for country_code in country_list:
-            query = belongs_to_tpl.format(get_escaped_str(str(country_code)), get_escaped_str(str(region_code)))
-            trans.run(query)
-    trans.commit()
-
+    # One batched statement per relation type, in a single transaction.
     trans = session.begin_transaction()
-    other_belongings: List[Tuple[int, int]] = [
-        (189, 298), (289, 298), (389, 498), (489, 498), (589, 798), (619, 798), (679, 798), (789, 798),
-        (298, 998), (498, 998), (798, 998), (89, 998)
-    ]
-    for country_code, master_region_code in other_belongings:
-        query = belongs_to_tpl.format(get_escaped_str(str(country_code)), get_escaped_str(str(master_region_code)))
-        trans.run(query)
+    trans.run(REGION_EDGE_TPL.format("BELONGS_TO"), {"rows": get_region_rows(False)})
+    trans.run(REGION_EDGE_TPL.format("IN_REGION"), {"rows": get_region_rows(True)})
     trans.commit()
 
     session.close()
@@ -215,6 +168,18 @@ where _1 <= com.period_start < _1 + 10000
 return act, bud, loc, loc2, com
 """
 
+"""
+# Summing the budgets of all countries and sub-regions of a region (Africa in this example) in a year's period, through
+# the precomputed IN_REGION relations instead of a variable-length BELONGS_TO path.
+
+with 20140101 as _1
+match (act:Activity)-[:EXECUTED_IN]->(loc:Location)-[:IN_REGION]->(reg:Location {code:'298'})
+match (act:Activity)-[com:COMMITS]->(bud:Budget)
+with distinct _1, act, bud, com
+where _1 <= com.period_start < _1 + 10000
+return sum(bud.value) as amount
+"""
+
 """
 # Summing the amount of budgets of a country (Mali in this example) would receive in a year's period.
 
@@ -0,0 +1,105 @@
+import random
+from typing import TextIO
+from xml.sax.saxutils import escape, quoteattr
+
+# Shaped like the Dutch IATI files: same elements, attributes and nesting as read by ActivityExtractor.
+COUNTRY_CODES = ["AF", "BD", "BF", "BI", "BJ", "CD", "ET", "GH", "ID", "KE", "ML", "MZ", "PS", "RW", "SD", "SS",
+                 "TZ", "UG", "VN", "YE"]
+REGION_CODES = ["89", "189", "289", "298", "389", "489", "498", "589", "619", "679", "789", "798", "998"]
+POLICY_NAMES = ["Gender Equality", "Aid to Environment", "Participatory Development/Good Governance",
+                "Trade Development", "Biodiversity", "Climate Change - Mitigation", "Climate Change - Adaptation",
+                "Desertification"]
+MINISTRY_REF = "XM-DAC-7"
+MINISTRY_NAME = "Ministry of Foreign Affairs (DGIS)"
+
+
+def get_date(rnd: random.Random, first_year: int, last_year: int) -> str:
+    return "{:04d}-{:02d}-{:02d}".format(rnd.randint(first_year, last_year), rnd.randint(1, 12), rnd.randint(1, 28))
+
+
+def get_org(index: int) -> str:
+    # Every fifth organization has no ref, like 'Steps Towards Development'.
+    return "Organization {} & Partners".format(index), None if index % 5 == 4 else "NL-KVK-{}".format(10000 + index)
+
+
+def write_org(f: TextIO, tag: str, name: str, ref: str, attrs: str = "") -> None:
+    ref_attr = " ref={}".format(quoteattr(ref)) if ref is not None else ""
+    f.write("   <{}{}{}><narrative>{}</narrative></{}>\n".format(tag, ref_attr, attrs, escape(name), tag))
+
+
+def write_activity(f: TextIO, rnd: random.Random, index: int, transactions: int, disbursements: int, orgs: int,
+                   policy_markers: int, max_partners: int) -> None:
+    f.write(" <iati-activity>\n")
+    f.write("  <iati-identifier>NL-1-SYN-{}</iati-identifier>\n".format(index))
+    f.write("  <reporting-org ref={} type=\"10\"><narrative>{}</narrative></reporting-org>\n"
+            .format(quoteattr(MINISTRY_REF), escape(MINISTRY_NAME)))
+    f.write("  <title><narrative>Synthetic activity {}</narrative></title>\n".format(index))
+    f.write("  <description><narrative>Support to programme {}, it's \"synthetic\" &amp; reproducible"
+            "</narrative></description>\n".format(index))
+    f.write("  <participating-org ref={} role=\"1\" type=\"10\"><narrative>{}</narrative></participating-org>\n"
+            .format(quoteattr(MINISTRY_REF), escape(MINISTRY_NAME)))
+    partners = sorted(set(rnd.randrange(orgs) for _ in range(rnd.randint(1, max_partners))))
+    for partner in partners:
+        name, ref = get_org(partner)
+        ref_attr = " ref={}".format(quoteattr(ref)) if ref is not None else ""
+        f.write("  <participating-org{} role=\"4\" type=\"21\"><narrative>{}</narrative></participating-org>\n"
+                .format(ref_attr, escape(name)))
+    f.write("  <activity-status code=\"{}\"/>\n".format(rnd.randint(1, 5)))
+    f.write("  <activity-date iso-date=\"{}\" type=\"1\"/>\n".format(get_date(rnd, 1997, 2012)))
+    f.write("  <activity-date iso-date=\"{}\" type=\"3\"/>\n".format(get_date(rnd, 2013, 2020)))
+    if rnd.random() < 0.8:
+        code = rnd.choice(COUNTRY_CODES)
+        f.write("  <recipient-country code=\"{0}\"><narrative>COUNTRY {0}</narrative></recipient-country>\n"
+                .format(code))
+    else:
+        code = rnd.choice(REGION_CODES)
+        f.write("  <recipient-region code=\"{0}\"><narrative>REGION {0}</narrative></recipient-region>\n"
+                .format(code))
+    for code in range(1, policy_markers + 1):
+        name = POLICY_NAMES[(code - 1) % len(POLICY_NAMES)]
+        f.write("  <policy-marker code=\"{}\" significance=\"{}\" vocabulary=\"1\"><narrative>{}</narrative>"
+                "</policy-marker>\n".format(code, rnd.randint(0, 2), escape(name)))
+    year = rnd.randint(1997, 2017)
+    f.write("  <budget type=\"1\" status=\"2\"><period-start iso-date=\"{0}-01-01\"/>"
+            "<period-end iso-date=\"{0}-12-31\"/><value currency=\"EUR\" value-date=\"{0}-01-01\">{1}</value>"
+            "</budget>\n".format(year, rnd.randint(1000, 10 ** 8)))
+    for _ in range(disbursements):
+        f.write("  <planned-disbursement type=\"1\"><period-start iso-date=\"{0}-01-01\"/>"
+                "<period-end iso-date=\"{0}-12-31\"/><value currency=\"EUR\" value-date=\"{0}-01-01\">{1}</value>"
+                "</planned-disbursement>\n".format(rnd.randint(year, year + 3), rnd.randint(100, 10 ** 7)))
+    for _ in range(transactions):
+        name, ref = get_org(rnd.choice(partners))
+        date = get_date(rnd, year, year + 3)
+        f.write("  <transaction><transaction-type code=\"{}\"/><transaction-date iso-date=\"{}\"/>"
+                "<value currency=\"EUR\" value-date=\"{}\">{}</value>\n"
+                .format(rnd.choice((2, 3, 3)), date, date, rnd.randint(100, 10 ** 7)))
+        write_org(f, "provider-org", MINISTRY_NAME, MINISTRY_REF)
+        write_org(f, "receiver-org", name, ref)
+        f.write("  </transaction>\n")
+    f.write(" </iati-activity>\n")
+
+
+def generate_iati(path: str, activities: int = 1000, transactions: int = 5, disbursements: int = 2, orgs: int = 50,
+                  policy_markers: int = 3, partners: int = 3, seed: int = 0) -> None:
+    """
+    Writes a synthetic IATI activity file. The same arguments always produce the same file.
+    :param path: Output file.
+    :param activities: Number of 'iati-activity' elements.
+    :param transactions: Transactions per activity.
+    :param disbursements: Planned disbursements per activity.
+    :param orgs: Number of distinct participating organizations (besides the Ministry).
+    :param policy_markers: Policy markers per activity.
+    :param partners: Maximum number of participating organizations per activity (besides the Ministry).
+    :param seed: Seed of the random generator.
+    """
+    rnd = random.Random(seed)
+    with open(path, "w", encoding="utf8") as f:
+        f.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+        f.write("<iati-activities version=\"2.02\" generated-datetime=\"2017-06-30T00:00:00\">\n")
+        for i in range(activities):
+            write_activity(f, rnd, i, transactions, disbursements, orgs, policy_markers, partners)
+        f.write("</iati-activities>\n")
+
+
+if __name__ == '__main__':
+    generate_iati("../data/IATIACTIVITIES_SYNTHETIC.xml")